@@ -1,25 +1,44 @@
 #! /usr/bin/env python3
 """
-Unzips a Bandcamp ZIP file, and then processes the files to to place them
-under the current directory in this format:
+Unzips a Bandcamp ZIP file, extracting the files straight to their final
+names under the current directory in this format:
 
     <artist>/<album>/<track#> - <track name>.<extension>
+
+Many ZIP files (or directories of them) can be unwrapped at once, in parallel.
+The members of a ZIP file can be listed, from its central directory alone,
+without extracting anything, and just the audio files, or just some of the
+tracks, can be extracted. Each member is verified against its CRC as it is
+extracted, and an album only appears once all of its members have been.
+Lossless tracks (FLAC, WAV and AIFF) can then be transcoded by ffmpeg.
 """
 
 import argparse
+import contextlib
+import errno
+import functools
+import glob
+import io
+import json
 import logging
 import os.path
 import re
+import shutil
+import subprocess
 import sys
+import time
 import zipfile
-from dataclasses import dataclass
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from typing import Iterator, TextIO
 
 program: str = ""
 
 
-def parse_args(argv: list[str]) -> str:
+def parse_args(argv: list[str]) -> argparse.Namespace:
     """
-    Given command-line arguments, return a str that names a ZIP file.
+    Given command-line arguments, return the parsed arguments.
     """
     parser = argparse.ArgumentParser(
         description="""\
@@ -33,17 +52,121 @@ def parse_args(argv: list[str]) -> str:
     )
     parser.add_argument(
         "zipfile",
+        nargs="+",
+        help="""\
+            zipfile is the path to a ZIP file downloaded from Bandcamp, a
+            directory containing such ZIP files, or a glob pattern matching
+            them. When more than one ZIP file is specified, they are unwrapped
+            in parallel and a summary is printed at the end.""",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="""\
+            jobs is the number of ZIP files unwrapped, and the number of
+            tracks transcoded, in parallel. The default is the number of
+            CPUs.""",
+    )
+    parser.add_argument(
+        "-l",
+        "--list",
+        action="store_true",
+        help="""\
+            list the members of each ZIP file, with their sizes and the names
+            they would be extracted to, without extracting anything. Only the
+            ZIP file's central directory is read.""",
+    )
+    parser.add_argument(
+        "-a",
+        "--audio-only",
+        action="store_true",
+        help="extract (or list) only the music files, skipping cover art etc.",
+    )
+    parser.add_argument(
+        "-t",
+        "--tracks",
+        type=parse_track_range,
+        help="""\
+            extract (or list) only the specified tracks, given as a
+            comma-separated list of track numbers and ranges, e.g. 3-5 or
+            1,3,7-9. Implies --audio-only.""",
+    )
+    parser.add_argument(
+        "--artist",
         help="""\
-            zipfile is the path to a ZIP file downloaded from Bandcamp.""",
+            specify the artist name, for when the artist name (or the album
+            name) has an embedded " - ", so that the artist and album can't
+            otherwise be told apart. By default, the artist name is assumed
+            not to have one.""",
+    )
+    parser.add_argument(
+        "--transcode",
+        choices=sorted(TRANSCODE_CODECS),
+        help="""\
+            after unwrapping, transcode the lossless (FLAC, WAV and AIFF)
+            tracks to the specified codec with ffmpeg, replacing them.""",
+    )
+    parser.add_argument(
+        "--transcode-log",
+        default=DEFAULT_TRANSCODE_LOG,
+        help=f"""\
+            specify the file in which transcoding jobs are logged, so that
+            those that are interrupted are resumed by the next run (from
+            whichever directory). The default is {DEFAULT_TRANSCODE_LOG}.""",
     )
 
     args = parser.parse_args(argv)
     logging.debug("args=%s", args)
 
-    # extract required zipfile argument
-    zipfile_arg = args.zipfile
-    logging.debug("zipfile=%s", zipfile_arg)
-    return zipfile_arg
+    if args.jobs < 1:
+        parser.error("number of jobs must be at least 1")
+
+    return args
+
+
+def parse_track_range(track_range: str) -> frozenset[int]:
+    """
+    Given a comma-separated list of track numbers and ranges of track
+    numbers (e.g. "1,3,7-9"), return the set of track numbers.
+    """
+    tracks = set()
+    for part in track_range.split(","):
+        first, _, last = part.strip().partition("-")
+        try:
+            first_track = int(first)
+            last_track = int(last) if last else first_track
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"invalid track range '{track_range}'"
+            ) from None
+        if first_track > last_track:
+            raise argparse.ArgumentTypeError(f"empty track range '{part}'")
+        tracks.update(range(first_track, last_track + 1))
+    return frozenset(tracks)
+
+
+def find_zip_files(zipfile_args: list[str]) -> list[str]:
+    """
+    Given zipfile arguments, return the paths of the ZIP files they specify:
+    directories are replaced by the ZIP files within them, and glob patterns
+    (which the shell hasn't expanded) by the files that they match.
+    """
+    zip_filenames = []
+    for zipfile_arg in zipfile_args:
+        if os.path.isdir(zipfile_arg):
+            zip_filenames += sorted(
+                os.path.join(zipfile_arg, entry)
+                for entry in os.listdir(zipfile_arg)
+                if entry.lower().endswith(".zip")
+            )
+        elif not os.path.exists(zipfile_arg) and glob.has_magic(zipfile_arg):
+            zip_filenames += sorted(glob.glob(zipfile_arg))
+        else:
+            zip_filenames.append(zipfile_arg)
+    logging.debug("zip_filenames=%s", zip_filenames)
+    return zip_filenames
 
 
 CHOP_MARKER = "..."
@@ -87,41 +210,307 @@ class ZipFileComponents:
 NAME_COMPONENT_SEPARATOR = " - "
 
 
-def parse_zip_filename(zip_filename: str) -> ZipFileComponents:
-    """Given the name of a ZIP file, extract the basename, artist name, and album name."""
-    # NB: this breaks if the artist name has an embedded " - " string
-    artist_album_regexp = r"^((.+?)" + NAME_COMPONENT_SEPARATOR + r"(.+))\.zip$"
-    zf_parts_re = re.compile(artist_album_regexp, re.IGNORECASE)
-    zf_parts_m = zf_parts_re.match(zip_filename)
-    if not zf_parts_m:
-        print(
-            f"{program}: could not match artist / album in '{zip_filename}'",
-            file=sys.stderr,
-        )
-        return 1
+# A ZIP file is named "<artist> - <album>.zip", though perhaps with a suffix
+# such as " (1)" if it was downloaded more than once, and its music files are
+# named "<artist> - <album> - <track#> <track name>.<extension>".
+ZIP_FILENAME_RE = re.compile(r"^(.+?)(?: \(\d+\))?\.zip$", re.IGNORECASE)
+MUSIC_FILE_RE = re.compile(
+    r".*(\d\d) (.+\.(?:aiff?|flac|m4a|mp3|ogg|wav))", re.IGNORECASE
+)
+TRACK_NAME_RE = re.compile(r"\d\d ")
+
+# the number of (recent) names whose components are remembered
+NAME_CACHE_SIZE = 256
 
-    zfc = ZipFileComponents(
-        basename=zf_parts_m.group(1) + NAME_COMPONENT_SEPARATOR,
-        artist=zf_parts_m.group(2),
-        album=zf_parts_m.group(3),
+
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
+def split_artist_album(
+    name: str, artist: str | None = None
+) -> ZipFileComponents | None:
+    """
+    Given a name in the form "<artist> - <album>", return its components,
+    or None if it isn't in that form. As the artist name or the album name
+    may have an embedded " - " string, the artist name may be specified;
+    otherwise it's assumed not to have one.
+    """
+    if artist is not None:
+        album = name.removeprefix(artist + NAME_COMPONENT_SEPARATOR)
+        if album == name or not album:
+            return None
+    else:
+        artist, separator, album = name.partition(NAME_COMPONENT_SEPARATOR)
+        if not (artist and separator and album):
+            return None
+    return ZipFileComponents(
+        basename=name + NAME_COMPONENT_SEPARATOR, artist=artist, album=album
     )
-    logging.debug("zfc='%s'", zfc)
 
+
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
+def parse_zip_filename(
+    zip_filename: str, artist: str | None = None
+) -> ZipFileComponents | None:
+    """
+    Given the name of a ZIP file, extract the basename, artist name, and
+    album name, returning None if they can't be found.
+    """
+    zf_name_m = ZIP_FILENAME_RE.match(zip_filename)
+    if not zf_name_m:
+        return None
+    zfc = split_artist_album(zf_name_m.group(1), artist)
+    logging.debug("zfc='%s'", zfc)
     return zfc
 
 
-def make_music_file_re():
-    """Return a RE matching music files."""
-    music_file_regexp = r".*(\d\d) (.+\.m4a)"
-    music_file_re = re.compile(music_file_regexp, re.IGNORECASE)
-    logging.debug("music_file_re=%s", music_file_re)
-    return music_file_re
+def parse_member_names(
+    member_names: list[str], artist: str | None = None
+) -> ZipFileComponents | None:
+    """
+    Given the names of the members of a ZIP file (sans directories), extract
+    the basename, artist name, and album name from the prefix common to all
+    of its music files, returning None if they can't be found. Unlike the
+    name of the ZIP file, which may have been changed, this prefix is always
+    "<artist> - <album> - ", followed by the track number.
+    """
+    music_names = [name for name in member_names if MUSIC_FILE_RE.match(name)]
+    if not music_names:
+        return None
 
+    # the prefix ends with the last separator after which every music file
+    # has a track number; the common prefix may extend into the track names
+    common_prefix = os.path.commonprefix(music_names)
+    end = common_prefix.rfind(NAME_COMPONENT_SEPARATOR)
+    while end > 0:
+        basename_len = end + len(NAME_COMPONENT_SEPARATOR)
+        if all(TRACK_NAME_RE.match(name, basename_len) for name in music_names):
+            zfc = split_artist_album(common_prefix[:end], artist)
+            logging.debug("zfc='%s'", zfc)
+            return zfc
+        end = common_prefix.rfind(NAME_COMPONENT_SEPARATOR, 0, end)
 
-def main() -> int:
-    """Simple main()"""
+    return None
+
+
+# The number of members of a ZIP file extracted (and verified) at once;
+# extra threads only help when there are CPUs to decompress on.
+EXTRACT_THREADS = min(4, os.cpu_count() or 1)
+
+# Members are copied out of the ZIP file in chunks of this size, so memory
+# use doesn't grow with the size of the members. The threads share the
+# usual copy buffer size between them, so that, all told, they need no more
+# memory than a single copy does.
+COPY_BUFFER_SIZE = shutil.COPY_BUFSIZE // EXTRACT_THREADS
+
+
+@dataclass
+class MemberPlan:
+    """Small class to hold the file name a ZIP file member is extracted to."""
+
+    info: zipfile.ZipInfo
+    filename: str  # name of the member within the ZIP file, sans directories
+    new_filename: str  # name of the extracted file
+    is_music: bool
+    track_number: int = 0  # for music files
+
+
+def plan_extraction(zf: zipfile.ZipFile, zfc: ZipFileComponents) -> list[MemberPlan]:
+    """
+    Given an open ZIP file, return the plan for extracting each of its
+    (non-directory) members. Music files have the ZIP file's basename
+    removed, and a name component separator put between the track number
+    and track name; other files keep their names, and the directories they
+    are in (such as 'scans/cover.jpg'). Should two members end up with the
+    same name, the later one is given a numbered suffix.
+
+    Only the ZIP file's central directory is read (when it was opened), so
+    planning costs the same however large the members are.
+    """
+    plans = []
+    taken: set[str] = set()
+    for info in zf.infolist():
+        if info.is_dir():
+            continue
+        filename = os.path.basename(info.filename)
+        logging.debug("filename=%s", filename)
 
-    zip_filename = parse_args(sys.argv[1:])
+        unprefixed_filename = filename.removeprefix(zfc.basename)
+        logging.debug("unprefixed_filename=%s", unprefixed_filename)
+
+        music_file_match = MUSIC_FILE_RE.match(unprefixed_filename)
+        if not music_file_match:
+            new_filename = unique_filename(member_path(info.filename), taken)
+            plans.append(MemberPlan(info, filename, new_filename, False))
+            continue
+
+        track_number = music_file_match.group(1)
+        track_name = music_file_match.group(2)
+        new_filename = unique_filename(
+            f"{track_number}{NAME_COMPONENT_SEPARATOR}{track_name}", taken
+        )
+        plans.append(MemberPlan(info, filename, new_filename, True, int(track_number)))
+
+    return plans
+
+
+UNNAMED_MEMBER = "unnamed"
+
+
+def member_path(member_name: str) -> str:
+    """
+    Given the name of a ZIP file member, return it as a relative path, with
+    any components that could take it outside the extraction directory
+    (such as '..') dropped. A name with no other components (such as '..'
+    itself) is replaced by UNNAMED_MEMBER.
+    """
+    components = [c for c in member_name.split("/") if c not in ("", ".", "..")]
+    if not components:
+        return UNNAMED_MEMBER
+    return os.path.join(*components)
+
+
+def unique_filename(filename: str, taken: set[str]) -> str:
+    """
+    Return 'filename', or if it's in 'taken', the first of 'name (2).ext',
+    'name (3).ext' etc. that isn't, adding the name returned to 'taken'.
+    Names are compared without regard to case, for case-insensitive
+    filesystems.
+    """
+    root, extension = os.path.splitext(filename)
+    unique = filename
+    suffix = 1
+    while unique.casefold() in taken:
+        suffix += 1
+        unique = f"{root} ({suffix}){extension}"
+    taken.add(unique.casefold())
+    return unique
+
+
+def extract_members(
+    zf: zipfile.ZipFile, plans: list[MemberPlan], subdir: str
+) -> Iterator[MemberPlan]:
+    """
+    Extract the planned members of an open ZIP file into 'subdir', in
+    parallel threads, yielding each plan, in order, once its member has been
+    extracted. Each member's CRC is checked as it's decompressed, so a
+    corrupt member raises BadZipFile (and a truncated one EOFError) without
+    a separate verification pass. Members not yet started when one fails
+    are abandoned.
+    """
+    # zlib releases the GIL while decompressing, and ZipFile supports
+    # reading several members at once (each seeks the shared file under a
+    # lock), so members are decompressed and verified in parallel
+    with ThreadPoolExecutor(max_workers=EXTRACT_THREADS) as executor:
+        try:
+            extracted = executor.map(
+                lambda plan: extract_member(zf, plan, subdir), plans
+            )
+            for plan, _ in zip(plans, extracted):
+                yield plan
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+
+@dataclass(frozen=True)
+class UnwrapOptions:
+    """Small class to hold the options controlling how ZIP files are unwrapped."""
+
+    list_only: bool = False
+    audio_only: bool = False
+    tracks: frozenset[int] | None = None  # None means all tracks
+    artist: str | None = None  # None means the artist is found automatically
+
+    def selects(self, plan: MemberPlan) -> bool:
+        """Return whether the plan's member is to be extracted (or listed)."""
+        if not plan.is_music:
+            return not (self.audio_only or self.tracks)
+        return self.tracks is None or plan.track_number in self.tracks
+
+
+def print_listing(plans: list[MemberPlan]) -> None:
+    """
+    Print the size and compressed size of each planned member, and the name
+    it would be extracted to, followed by the totals.
+    """
+    print(f"{'size':>12} {'compressed':>12}  member -> extracted name")
+    for plan in plans:
+        filename = shorten_info_string(plan.filename, 56)
+        print(
+            f"{plan.info.file_size:>12} {plan.info.compress_size:>12}  "
+            f"{filename:<58} -> {plan.new_filename}"
+        )
+    total_size = sum(plan.info.file_size for plan in plans)
+    total_compressed = sum(plan.info.compress_size for plan in plans)
+    print(f"{total_size:>12} {total_compressed:>12}  {len(plans)} members")
+
+
+def preallocate(fd: int, size: int) -> None:
+    """
+    Preallocate 'size' bytes for the file open on 'fd', if the platform and
+    filesystem support it, so that the filesystem can allocate contiguous
+    extents, and a full filesystem is found out before anything is written.
+    """
+    if size == 0 or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+
+
+def extract_member(zf: zipfile.ZipFile, plan: MemberPlan, subdir: str) -> None:
+    """
+    Stream a ZIP file member straight to its new file name within 'subdir',
+    a chunk at a time.
+    """
+    new_path = os.path.join(subdir, plan.new_filename)
+    if os.path.dirname(plan.new_filename):
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    # ZipExtFile has no readinto() of its own (the inherited one reads into a
+    # new bytes object and copies it), so each chunk read is written directly
+    with zf.open(plan.info) as member_file, open(new_path, "xb") as new_file:
+        preallocate(new_file.fileno(), plan.info.file_size)
+        while chunk := member_file.read(COPY_BUFFER_SIZE):
+            new_file.write(chunk)
+            del chunk  # so that it's freed before the next is read
+
+
+@dataclass
+class UnwrapResult:
+    """Small class to hold the outcome of unwrapping a ZIP file."""
+
+    zip_filename: str
+    status: int = 1
+    subdir: str = ""
+    num_tracks: int = 0
+    seconds: float = 0.0
+    tracks: list[str] = field(default_factory=list)  # paths of extracted tracks
+    output: str = ""  # buffered standard output, when unwrapped in parallel
+    errors: str = ""  # buffered standard error, when unwrapped in parallel
+
+
+def make_temp_dir(parent: str, prefix: str) -> str:
+    """
+    Create a new, uniquely named directory in 'parent', returning its path.
+    Unlike tempfile.mkdtemp(), whose mode of 0700 os.rename() would keep,
+    the directory gets the usual mode allowed by the umask.
+    """
+    attempt = 0
+    while True:
+        path = os.path.join(parent, f"{prefix}{os.getpid()}.{attempt}")
+        try:
+            os.mkdir(path)
+            return path
+        except FileExistsError:
+            attempt += 1
+
+
+def extract_zip(zip_filename: str, options: UnwrapOptions, result: UnwrapResult) -> int:
+    """
+    Extract the specified ZIP file under the current directory (or just list
+    its members), as directed by 'options', recording the directory
+    extracted to and the number of tracks in 'result'. Returns the exit status.
+    """
     if not os.path.isfile(zip_filename):
         print(
             f"{program}: ZIP file argument '{zip_filename}' is not a file",
@@ -129,51 +518,333 @@ def main() -> int:
         )
         return 1
 
-    zfc = parse_zip_filename(zip_filename)
+    try:
+        with zipfile.ZipFile(zip_filename) as zf:
+            return extract_open_zip(zip_filename, zf, options, result)
+    except (zipfile.BadZipFile, OSError) as e:
+        print(f"{program}: {zip_filename}: {e}", file=sys.stderr)
+        return 1
+
+
+def extract_open_zip(
+    zip_filename: str, zf: zipfile.ZipFile, options: UnwrapOptions, result: UnwrapResult
+) -> int:
+    """
+    Extract the specified open ZIP file, as extract_zip() does.
+    """
+    # the artist and album are found from the names of the music files in
+    # the ZIP file's central directory, falling back on the ZIP file's name
+    member_names = [
+        os.path.basename(info.filename) for info in zf.infolist() if not info.is_dir()
+    ]
+    zfc = parse_member_names(member_names, options.artist) or parse_zip_filename(
+        os.path.basename(zip_filename), options.artist
+    )
+    if zfc is None:
+        print(
+            f"{program}: could not match artist / album in '{zip_filename}'",
+            file=sys.stderr,
+        )
+        return 1
 
     subdir = os.path.join(zfc.artist, zfc.album)
     logging.debug("subdir='%s'", subdir)
+    result.subdir = subdir
+
+    plans = plan_extraction(zf, zfc)
+    plans = [plan for plan in plans if options.selects(plan)]
 
-    os.makedirs(subdir, exist_ok=True)
-    logging.debug("os.makedirs() for '%s' successful", subdir)
+    if options.list_only:
+        result.num_tracks = sum(1 for plan in plans if plan.is_music)
+        print_listing(plans)
+        return 0
 
-    if len(os.listdir(subdir)) > 0:
+    if os.path.isdir(subdir) and len(os.listdir(subdir)) > 0:
         print(f"{program}: found pre-existing files in '{subdir}'", file=sys.stderr)
         return 1
 
-    with zipfile.ZipFile(zip_filename) as zf:
-        zf.extractall(subdir)
+    os.makedirs(zfc.artist, exist_ok=True)
+    logging.debug("os.makedirs() for '%s' successful", zfc.artist)
+
+    # the album is extracted into a temporary directory alongside it, which
+    # is renamed into place only once every member has been extracted and
+    # verified, so that a corrupt or truncated ZIP file never leaves a
+    # partial album behind
+    tmpdir = make_temp_dir(zfc.artist, f".{zfc.album}.")
+    logging.debug("tmpdir='%s'", tmpdir)
+    try:
+        for plan in extract_members(zf, plans, tmpdir):
+            if plan.is_music:
+                filename = shorten_info_string(plan.filename, 56)
+                print(f"{filename:<58} -> {plan.new_filename}")
+                result.num_tracks += 1
+                result.tracks.append(os.path.join(subdir, plan.new_filename))
+            else:
+                print(f"{plan.info.filename}: not a music file", file=sys.stderr)
+        os.rename(tmpdir, subdir)
+    except (zipfile.BadZipFile, EOFError, OSError, zlib.error) as e:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        result.num_tracks = 0
+        result.tracks = []
+        # the artist directory is left alone: it may have been made by the
+        # user, or be in use by another ZIP file by the same artist
+        print(f"{program}: {zip_filename}: {e} (nothing extracted)", file=sys.stderr)
+        return 1
+
+    return 0
 
-    music_file_re = make_music_file_re()
 
-    for filename in os.listdir(subdir):
-        logging.debug("filename=%s", filename)
+def unwrap_zip(zip_filename: str, options: UnwrapOptions) -> UnwrapResult:
+    """
+    Unwrap the specified ZIP file, returning the outcome. Any failure is
+    confined to the ZIP file in question.
+    """
+    start = time.perf_counter()
+    result = UnwrapResult(zip_filename)
+    try:
+        result.status = extract_zip(zip_filename, options, result)
+    except Exception as e:  # one bad ZIP file mustn't abort the rest
+        print(f"{program}: {zip_filename}: {e}", file=sys.stderr)
+        result = UnwrapResult(zip_filename)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def unwrap_zip_buffered(zip_filename: str, options: UnwrapOptions) -> UnwrapResult:
+    """
+    Unwrap the specified ZIP file, as unwrap_zip() does, but buffering its
+    output, so that ZIP files unwrapped in parallel don't interleave their
+    output.
+    """
+    out = io.StringIO()
+    err = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        action = "listing" if options.list_only else "unwrapping"
+        print(f"{action}: {zip_filename}")
+        result = unwrap_zip(zip_filename, options)
+    result.output = out.getvalue()
+    result.errors = err.getvalue()
+    return result
 
-        if not os.path.isfile(os.path.join(subdir, filename)):
-            print(f"{filename}: not a file", file=sys.stderr)
-            continue
 
-        unprefixed_filename = filename.removeprefix(zfc.basename)
-        logging.debug("unprefixed_filename=%s", unprefixed_filename)
+def init_worker(program_name: str) -> None:
+    """Initialise a worker process, which may not have run __main__."""
+    global program
+    program = program_name
 
-        music_file_match = music_file_re.match(unprefixed_filename)
-        if not music_file_match:
-            print(f"{filename}: not a music file", file=sys.stderr)
-            continue
 
-        # new filename removes the prefix and puts a name component
-        # separator between the track number and track name
-        track_number = music_file_match.group(1)
-        track_name = music_file_match.group(2)
-        new_filename = f"{track_number}{NAME_COMPONENT_SEPARATOR}{track_name}"
+def print_summary(results: list[UnwrapResult]) -> None:
+    """
+    Print a table summarising the outcome of unwrapping each ZIP file.
+    """
+    print(f"{'status':<7} {'tracks':>6} {'seconds':>8}  ZIP file -> directory")
+    for result in results:
+        status = "ok" if result.status == 0 else "FAILED"
+        destination = f" -> {result.subdir}" if result.subdir else ""
+        print(
+            f"{status:<7} {result.num_tracks:>6} {result.seconds:>8.2f}  "
+            f"{result.zip_filename}{destination}"
+        )
+    num_failed = sum(1 for result in results if result.status != 0)
+    print(f"{len(results)} ZIP files, {num_failed} failed")
+
+
+# The codecs that lossless tracks can be transcoded to, with the extension of
+# the transcoded files and ffmpeg's arguments for encoding them.
+TRANSCODE_CODECS = {
+    "aac": (".m4a", ["-c:a", "aac", "-b:a", "256k"]),
+    "alac": (".m4a", ["-c:a", "alac"]),
+    "flac": (".flac", ["-c:a", "flac"]),
+    "mp3": (".mp3", ["-c:a", "libmp3lame", "-q:a", "0"]),
+    "opus": (".opus", ["-c:a", "libopus", "-b:a", "192k"]),
+}
+LOSSLESS_EXTENSIONS = (".aif", ".aiff", ".flac", ".wav")
+DEFAULT_TRANSCODE_LOG = os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state"),
+    "bandcamp_unwrap",
+    "transcode.jsonl",
+)
+FFMPEG = "ffmpeg"
 
-        print(f"{shorten_info_string(filename, 56):<58} -> {new_filename}")
 
-        old_path = os.path.join(subdir, filename)
-        new_path = os.path.join(subdir, new_filename)
-        os.rename(old_path, new_path)
+@dataclass
+class TranscodeJob:
+    """Small class to hold a track to be transcoded."""
 
-    return 0
+    source: str
+    target: str
+    codec: str
+
+
+def plan_transcodes(tracks: list[str], codec: str) -> list[TranscodeJob]:
+    """
+    Return the jobs transcoding each lossless track to 'codec', skipping
+    those that are already encoded with it. Tracks are given absolute paths,
+    so that the jobs can be resumed from any directory.
+    """
+    extension = TRANSCODE_CODECS[codec][0]
+    jobs = []
+    for track in tracks:
+        root, track_extension = os.path.splitext(os.path.abspath(track))
+        if track_extension.lower() in LOSSLESS_EXTENSIONS and (
+            track_extension.lower() != extension
+        ):
+            jobs.append(TranscodeJob(root + track_extension, root + extension, codec))
+    return jobs
+
+
+def load_pending_transcodes(log_path: str) -> list[TranscodeJob]:
+    """
+    Return the jobs in the transcoding log that were queued but never
+    finished, i.e. were interrupted, and whose tracks are still to be found.
+    Jobs that failed aren't retried, as a broken track would otherwise fail
+    every later run; transcoding its album again retries it.
+    """
+    pending = {}
+    try:
+        with open(log_path, encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut short by an interrupted run
+                job = TranscodeJob(record["source"], record["target"], record["codec"])
+                if record["event"] == "queued":
+                    pending[job.source] = job
+                else:
+                    pending.pop(job.source, None)
+    except FileNotFoundError:
+        return []
+    return [job for job in pending.values() if os.path.isfile(job.source)]
+
+
+def log_transcode(log_file: TextIO, event: str, job: TranscodeJob, **fields) -> None:
+    """Append an event for a job to the transcoding log, as a line of JSON."""
+    record = {"event": event, **asdict(job), **fields}
+    log_file.write(json.dumps(record) + "\n")
+    log_file.flush()
+
+
+def run_transcode(job: TranscodeJob) -> tuple[float, str | None]:
+    """
+    Transcode a track with ffmpeg, replacing it with the transcoded track.
+    Returns the time taken, in seconds, and an error message or None.
+    """
+    directory, target_filename = os.path.split(job.target)
+    stem, extension = os.path.splitext(target_filename)
+    # ffmpeg picks the output format from the extension, so it's kept
+    partial_path = os.path.join(directory, f".{stem}.partial{extension}")
+    command = [FFMPEG, "-nostdin", "-hide_banner", "-loglevel", "error", "-y"]
+    command += ["-i", job.source, "-map", "0:a", "-map_metadata", "0"]
+    command += TRANSCODE_CODECS[job.codec][1] + [partial_path]
+    logging.debug("command=%s", command)
+
+    start = time.perf_counter()
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, check=False)
+        if completed.returncode != 0:
+            with contextlib.suppress(OSError):
+                os.remove(partial_path)
+            error = completed.stderr.strip() or f"exit status {completed.returncode}"
+            return time.perf_counter() - start, error
+        os.replace(partial_path, job.target)
+        os.remove(job.source)
+    except OSError as e:
+        return time.perf_counter() - start, str(e)
+    return time.perf_counter() - start, None
+
+
+def transcode_tracks(
+    tracks: list[str], codec: str, num_jobs: int, log_path: str
+) -> int:
+    """
+    Transcode the lossless tracks to 'codec', along with any jobs left
+    pending by earlier runs, running up to 'num_jobs' ffmpeg processes at a
+    time. Each job is logged when queued and when done (or failed), so that
+    an interrupted run can be resumed. Returns the exit status.
+    """
+    jobs = {job.source: job for job in load_pending_transcodes(log_path)}
+    resumed = len(jobs)
+    for job in plan_transcodes(tracks, codec):
+        jobs[job.source] = job
+    if not jobs:
+        return 0
+    print(f"transcoding {len(jobs)} tracks ({resumed} resumed)")
+
+    start = time.perf_counter()
+    transcoding_seconds = 0.0
+    num_failed = 0
+    if os.path.dirname(log_path):
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    with open(log_path, "a", encoding="utf-8") as log_file:
+        for job in jobs.values():
+            log_transcode(log_file, "queued", job)
+        # each job runs in its own ffmpeg process, so threads suffice
+        with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+            futures = {
+                executor.submit(run_transcode, job): job for job in jobs.values()
+            }
+            for future in as_completed(futures):
+                job = futures[future]
+                seconds, error = future.result()
+                transcoding_seconds += seconds
+                if error is None:
+                    log_transcode(log_file, "done", job, seconds=round(seconds, 3))
+                    print(f"{seconds:>8.2f}  {job.source} -> {job.codec}")
+                else:
+                    num_failed += 1
+                    log_transcode(log_file, "failed", job, error=error)
+                    print(f"{program}: {job.source}: {error}", file=sys.stderr)
+
+    print(
+        f"{len(jobs) - num_failed} tracks transcoded, {num_failed} failed, "
+        f"in {time.perf_counter() - start:.2f}s "
+        f"({transcoding_seconds:.2f}s of transcoding)"
+    )
+    return 1 if num_failed else 0
+
+
+def main() -> int:
+    """Simple main()"""
+
+    args = parse_args(sys.argv[1:])
+    zip_filenames = find_zip_files(args.zipfile)
+    options = UnwrapOptions(
+        list_only=args.list,
+        audio_only=args.audio_only,
+        tracks=args.tracks,
+        artist=args.artist,
+    )
+    if not zip_filenames:
+        print(f"{program}: no ZIP files found", file=sys.stderr)
+        return 1
+    if args.transcode and shutil.which(FFMPEG) is None:
+        print(f"{program}: {FFMPEG} is needed to transcode", file=sys.stderr)
+        return 1
+
+    if len(zip_filenames) == 1:
+        results = [unwrap_zip(zip_filenames[0], options)]
+    else:
+        # decompression is CPU-bound, so unwrap in parallel processes,
+        # reporting each ZIP file's output together, in order
+        results = []
+        with ProcessPoolExecutor(
+            max_workers=args.jobs, initializer=init_worker, initargs=(program,)
+        ) as executor:
+            unwrap = functools.partial(unwrap_zip_buffered, options=options)
+            for result in executor.map(unwrap, zip_filenames):
+                sys.stdout.write(result.output)
+                sys.stderr.write(result.errors)
+                results.append(result)
+        print_summary(results)
+    status = 0 if all(result.status == 0 for result in results) else 1
+
+    if args.transcode and not args.list:
+        tracks = [track for result in results for track in result.tracks]
+        if transcode_tracks(tracks, args.transcode, args.jobs, args.transcode_log):
+            status = 1
+
+    return status
 
 
 if __name__ == "__main__":
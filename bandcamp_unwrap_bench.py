@@ -0,0 +1,194 @@
+#! /usr/bin/env python3
+"""
+Benchmark bandcamp_unwrap.py's extraction (the throughput, in megabytes per
+second, and the peak memory allocated, of unwrapping a synthetic ZIP file of
+large tracks, against ZipFile.extractall()), comparing the results against a
+saved JSON baseline so that changes which make it slower can be caught.
+Unwrapping needing more memory than ZipFile.extractall() is always a failure.
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os.path
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+program: str = ""
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+sys.path.insert(0, SCRIPT_DIR)
+import bandcamp_unwrap  # noqa: E402
+from bench_harness import make_parser, report  # noqa: E402
+
+DEFAULT_BASELINE = "bandcamp_unwrap_bench.json"
+DEFAULT_REPEATS = 3
+DEFAULT_ARCHIVE_MB = 256
+ARCHIVE_SEED = 1729
+NUM_TRACKS = 8
+COVER_SIZE = 4 * 1024 * 1024
+ARTIST = "Bench Artist"
+ALBUM = "Bench Album"
+MEGABYTE = 1024 * 1024
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    """
+    Given command-line arguments, return the parsed arguments.
+    """
+    parser = make_parser(
+        """\
+            Benchmark bandcamp_unwrap.py's extraction against
+            ZipFile.extractall() and compare the results against a baseline
+            previously saved by this program. The exit status is 1 if any
+            result is worse than the baseline by more than the tolerance, or
+            if unwrapping needs more memory than ZipFile.extractall().
+            """,
+        DEFAULT_BASELINE,
+        DEFAULT_REPEATS,
+    )
+    parser.add_argument(
+        "-m",
+        "--archive-mb",
+        type=int,
+        default=DEFAULT_ARCHIVE_MB,
+        help=f"""specify the size of the tracks in the ZIP file, in megabytes.
+        The default is {DEFAULT_ARCHIVE_MB}.""",
+    )
+
+    args = parser.parse_args(argv)
+    logging.debug("args=%s", args)
+    return args
+
+
+def make_archive(directory: str, archive_mb: int) -> str:
+    """
+    Write a reproducible Bandcamp-style ZIP file of NUM_TRACKS tracks,
+    totalling 'archive_mb' megabytes, and a cover image, in 'directory',
+    returning its path. Like real audio, the tracks are incompressible, and
+    so are stored rather than deflated.
+    """
+    rng = random.Random(ARCHIVE_SEED)
+    track_size = archive_mb * MEGABYTE // NUM_TRACKS
+    zip_filename = os.path.join(directory, f"{ARTIST} - {ALBUM}.zip")
+    with zipfile.ZipFile(zip_filename, "w", zipfile.ZIP_STORED) as zf:
+        for track in range(1, NUM_TRACKS + 1):
+            name = f"{ARTIST} - {ALBUM} - {track:02} Track {track}.flac"
+            with zf.open(name, "w", force_zip64=True) as member_file:
+                for _ in range(0, track_size, MEGABYTE):
+                    member_file.write(rng.randbytes(MEGABYTE))
+        zf.writestr("cover.jpg", rng.randbytes(COVER_SIZE), zipfile.ZIP_DEFLATED)
+    return zip_filename
+
+
+def extractall(zip_filename: str, directory: str) -> None:
+    """Extract the ZIP file into 'directory' with ZipFile.extractall()."""
+    with zipfile.ZipFile(zip_filename) as zf:
+        zf.extractall(directory)
+
+
+def unwrap(zip_filename: str, directory: str) -> None:
+    """Unwrap the ZIP file under 'directory' as bandcamp_unwrap.py does."""
+    with contextlib.chdir(directory), contextlib.redirect_stdout(io.StringIO()):
+        with contextlib.redirect_stderr(io.StringIO()):
+            result = bandcamp_unwrap.unwrap_zip(
+                os.path.abspath(zip_filename), bandcamp_unwrap.UnwrapOptions()
+            )
+    assert result.status == 0, f"{zip_filename}: unwrap failed"
+
+
+def check_unwrap(zip_filename: str, directory: str) -> None:
+    """
+    Check that bandcamp_unwrap.py extracts every member of the ZIP file to
+    the expected name and size, so that a benchmark can't appear to get
+    faster by getting things wrong.
+    """
+    unwrap(zip_filename, directory)
+    album_dir = os.path.join(directory, ARTIST, ALBUM)
+    with zipfile.ZipFile(zip_filename) as zf:
+        for info in zf.infolist():
+            name = info.filename.removeprefix(f"{ARTIST} - {ALBUM} - ")
+            if name != info.filename:
+                name = name[:2] + bandcamp_unwrap.NAME_COMPONENT_SEPARATOR + name[3:]
+            size = os.path.getsize(os.path.join(album_dir, name))
+            assert size == info.file_size, f"{name}: {size} != {info.file_size}"
+
+
+def bench_extract(zip_filename: str, work_dir: str, repeats: int) -> dict[str, float]:
+    """
+    Time extracting the ZIP file with ZipFile.extractall() and with
+    bandcamp_unwrap.py, each into a fresh directory, and measure the peak
+    memory allocated by each (in a separate run, as tracing slows it).
+    Return the throughput of each, in megabytes per second, and the peak
+    memory, in kilobytes.
+    """
+    with zipfile.ZipFile(zip_filename) as zf:
+        total_mb = sum(info.file_size for info in zf.infolist()) / MEGABYTE
+
+    results = {}
+    for name, func in (("extractall", extractall), ("unwrap", unwrap)):
+        times = []
+        for _ in range(repeats):
+            directory = tempfile.mkdtemp(dir=work_dir)
+            start = time.perf_counter()
+            func(zip_filename, directory)
+            times.append(time.perf_counter() - start)
+            shutil.rmtree(directory)
+        results[f"{name}_mb_per_sec"] = total_mb / min(times)
+
+        directory = tempfile.mkdtemp(dir=work_dir)
+        tracemalloc.start()
+        func(zip_filename, directory)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        shutil.rmtree(directory)
+        results[f"{name}_peak_kb"] = peak / 1024
+
+    return results
+
+
+def find_memory_excess(results: dict[str, float]) -> list[str]:
+    """
+    Given results, return a description of the excess if unwrapping needed
+    more memory at its peak than ZipFile.extractall() did: the point of
+    streaming members is that it shouldn't.
+    """
+    unwrap_peak = results["unwrap_peak_kb"]
+    extractall_peak = results["extractall_peak_kb"]
+    if unwrap_peak > extractall_peak:
+        return [f"unwrap_peak_kb: {unwrap_peak:.3f} (extractall {extractall_peak:.3f})"]
+    return []
+
+
+def main() -> int:
+    """Simple main()"""
+
+    args = parse_args(sys.argv[1:])
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        zip_filename = make_archive(work_dir, args.archive_mb)
+        check_dir = tempfile.mkdtemp(dir=work_dir)
+        check_unwrap(zip_filename, check_dir)
+        shutil.rmtree(check_dir)
+        results = bench_extract(zip_filename, work_dir, args.repeats)
+    return report(program, results, args, find_memory_excess(results))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%Y-%m-%dT%H:%M:%S%z",
+    )
+
+    program = sys.argv[0].rsplit("/", maxsplit=1)[-1]
+    logging.debug("program=%s", program)
+
+    sys.exit(main())
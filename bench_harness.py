@@ -0,0 +1,117 @@
+"""
+The parts shared by the *_bench.py programs: their common options, timing,
+and comparing their results against (or saving them as) a JSON baseline so
+that changes which make things slower can be caught.
+"""
+
+import argparse
+import json
+import sys
+import timeit
+
+DEFAULT_TOLERANCE = 0.2
+
+
+def make_parser(
+    description: str, default_baseline: str, default_repeats: int
+) -> argparse.ArgumentParser:
+    """
+    Return an argument parser with the given description and the options
+    common to every benchmark (-b, -s, -t and -n), to which a benchmark can
+    add its own.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        default=default_baseline,
+        help=f"""specify the baseline file. The default is {default_baseline}.""",
+    )
+    parser.add_argument(
+        "-s",
+        "--save",
+        action="store_true",
+        help="save the results as the new baseline rather than comparing against it",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f"""specify the fraction by which a result may be worse than the baseline
+        before it is reported as a regression. The default is {DEFAULT_TOLERANCE}.""",
+    )
+    parser.add_argument(
+        "-n",
+        "--repeats",
+        type=int,
+        default=default_repeats,
+        help=f"""specify the number of times each benchmark is repeated;
+        the best time is used. The default is {default_repeats}.""",
+    )
+    return parser
+
+
+def best_time(func, repeats: int) -> float:
+    """Return the best of 'repeats' timings of a single call of 'func'."""
+    return min(timeit.repeat(func, number=1, repeat=repeats))
+
+
+def find_regressions(
+    results: dict[str, float], baseline: dict[str, float], tolerance: float
+) -> list[str]:
+    """
+    Given results and a baseline, return a description of each result
+    that is worse than its baseline by more than 'tolerance'. Results named
+    '..._per_sec' are rates, for which larger is better; the rest are times
+    or sizes, for which smaller is.
+    """
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        base_value = baseline[name]
+        if name.endswith("_per_sec"):
+            worse = value < base_value * (1 - tolerance)
+        else:
+            worse = value > base_value * (1 + tolerance)
+        if worse:
+            regressions.append(f"{name}: {value:.3f} (baseline {base_value:.3f})")
+    return regressions
+
+
+def report(
+    program: str,
+    results: dict[str, float],
+    args: argparse.Namespace,
+    failures: list[str] = (),
+) -> int:
+    """
+    Print the results, then either save them as the baseline (if 'args.save')
+    or compare them against it, reporting any regressions, along with any
+    'failures' found by the benchmark itself. Return the exit status: 1 if
+    there were any regressions or failures, and 0 otherwise.
+    """
+    for name, value in results.items():
+        print(f"{name:<44} {value:16.3f}")
+
+    regressions = list(failures)
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+            baseline_file.write("\n")
+    else:
+        try:
+            with open(args.baseline, encoding="utf-8") as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions += find_regressions(results, baseline, args.tolerance)
+        except FileNotFoundError:
+            print(
+                f"{program}: no baseline '{args.baseline}' (use --save to create one)",
+                file=sys.stderr,
+            )
+
+    for regression in regressions:
+        print(f"{program}: regression: {regression}", file=sys.stderr)
+
+    return 1 if regressions else 0
@@ -5,17 +5,169 @@
 """
 Given an artist directory containing albums and tracks, create a mirroring
 hierarch of symlinks under the current directory, but where the track names
-have been transformed.
+have been transformed. Several artist directories, or a whole library of
+them, can be mirrored at once.
 """
 
-# import argparse
+import argparse
+import bisect
+import contextlib
+import errno
+import functools
+import hashlib
+import io
+import itertools
+import json
 import logging
+import mmap
 import os
 import os.path
 import sys
 import re
-from collections import namedtuple
-from typing import List
+import struct
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from stat import S_ISREG
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+# Linking is dominated by filesystem latency (particularly on network storage),
+# not by CPU, so run more jobs than there are CPUs.
+DEFAULT_JOBS = 8
+
+EXCLUDE_ENTRIES_RE = re.compile(r"\.DS_Store")
+TRACK_FILES_RE = re.compile(r".+(\.m4a|\.mp3)")
+
+
+# Album latency histogram bucket upper bounds, in milliseconds.
+LATENCY_BUCKETS_MS = [2**n for n in range(17)]
+# The number of slowest albums included in the statistics.
+NUM_SLOWEST_ALBUMS = 10
+# The minimum number of seconds between progress messages.
+PROGRESS_INTERVAL = 5.0
+
+
+class Metrics:
+    """
+    Counts, per-phase timings and per-album latencies for a run, which may
+    be updated from several threads.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.last_progress_time = self.start_time
+        self.counts = Counter()
+        self.phases = defaultdict(
+            lambda: {"count": 0, "total_sec": 0.0, "max_sec": 0.0}
+        )
+        self.album_latencies: List[Tuple[float, str]] = []
+
+    @contextlib.contextmanager
+    def timed(self, phase: str):
+        """
+        Context manager which adds the time taken by its body to 'phase'.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                stats = self.phases[phase]
+                stats["count"] += 1
+                stats["total_sec"] += elapsed
+                stats["max_sec"] = max(stats["max_sec"], elapsed)
+
+    def count(self, name: str, n: int = 1) -> None:
+        """Add 'n' to the count called 'name'."""
+        with self.lock:
+            self.counts[name] += n
+
+    def add_album_latency(self, album_path: str, elapsed: float) -> None:
+        """Record the time taken to link (or sync) the specified album."""
+        with self.lock:
+            self.album_latencies.append((elapsed, album_path))
+
+    def report_progress(self, albums_done: int, albums_total: int) -> None:
+        """
+        Log the progress of the run, at most every PROGRESS_INTERVAL seconds.
+        """
+        now = time.perf_counter()
+        if now - self.last_progress_time < PROGRESS_INTERVAL:
+            return
+        self.last_progress_time = now
+        rate = albums_done / (now - self.start_time)
+        eta = (albums_total - albums_done) / rate if rate else 0.0
+        logging.info(
+            "progress: %d/%d albums (%.1f albums/s, ETA %.0fs), %d tracks",
+            albums_done,
+            albums_total,
+            rate,
+            eta,
+            self.counts["tracks"],
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Return the metrics, summarised, as a dict suitable for dumping as JSON.
+        """
+        with self.lock:
+            latencies = sorted(self.album_latencies)
+            latencies_ms = [elapsed * 1000 for elapsed, _ in latencies]
+            histogram = Counter(
+                bisect.bisect_left(LATENCY_BUCKETS_MS, ms) for ms in latencies_ms
+            )
+            bucket_names = [f"<{ms}" for ms in LATENCY_BUCKETS_MS]
+            bucket_names.append(f">={LATENCY_BUCKETS_MS[-1]}")
+
+            def percentile(p: float) -> float:
+                if not latencies_ms:
+                    return 0.0
+                return latencies_ms[
+                    min(len(latencies_ms) - 1, int(p * len(latencies_ms)))
+                ]
+
+            return {
+                "elapsed_sec": time.perf_counter() - self.start_time,
+                "counts": dict(sorted(self.counts.items())),
+                "phases": dict(sorted(self.phases.items())),
+                "album_latency_ms": {
+                    "count": len(latencies_ms),
+                    "p50": percentile(0.5),
+                    "p90": percentile(0.9),
+                    "p99": percentile(0.99),
+                    "max": latencies_ms[-1] if latencies_ms else 0.0,
+                    "histogram": {
+                        bucket_names[i]: histogram[i] for i in sorted(histogram)
+                    },
+                },
+                "slowest_albums": [
+                    {"album": album_path, "sec": elapsed}
+                    for elapsed, album_path in reversed(latencies[-NUM_SLOWEST_ALBUMS:])
+                ],
+            }
+
+
+metrics = Metrics()
 
 
 def check_directory(directory_path: str) -> (bool, str):
@@ -33,37 +185,58 @@ def check_directory(directory_path: str) -> (bool, str):
     return True, ""
 
 
-def list_entries(path: str, include_re: str = None, exclude_re: str = None):
+def scan_entries(
+    path: str,
+    include_re: Union[str, Pattern] = None,
+    exclude_re: Union[str, Pattern] = None,
+    dirs_only: bool = False,
+) -> Iterator[Tuple[os.DirEntry, bool]]:
     """
-    Given a path to a directory, return a sorted list of entries
-    (files, directories, etc.) within that directory. The returned
-    entries can be constrained by regular expressions specified by
-    include_re and exclude_re.
+    Given a path to a directory, lazily yield each entry (file, directory,
+    etc.) within that directory, in no particular order, along with whether
+    it is selected: that is, it matches include_re (if provided), does not
+    match exclude_re (if provided), and, if dirs_only, is a directory.
+    The directory is read with a single scandir(), and entry types come
+    from the directory listing itself, so entries are not stat()ed on
+    most filesystems.
     :param path: Path to the directory whose entries should be listed.
-    :param include_re: If provided, only return entries that match (and do not match exclude_re).
-    :param exclude_re: If provided, exclude any entries that match.
-    :return: A sorted list of entries within the specified directory.
-    """
-    # NB: Not accepting compiled patterns because chances are
-    #     that is a premature optimization. If this becomes an
-    #     issue, we can start caching patterns here.
-    #     See https://stackoverflow.com/questions/47268595/when-to-use-re-compile
+    :param include_re: If provided, only select entries that match this (precompiled or not) pattern.
+    :param exclude_re: If provided, do not select entries that match this (precompiled or not) pattern.
+    :param dirs_only: If true, only select directories.
+    :return: An iterator of (os.DirEntry, selected) tuples.
+    """
     logging.debug("inc=%s", include_re)
     logging.debug("exc=%s", exclude_re)
 
+    include = re.compile(include_re).match if include_re is not None else None
+    exclude = re.compile(exclude_re).match if exclude_re is not None else None
+    with os.scandir(path) as entries:
+        for entry in entries:
+            selected = (
+                (exclude is None or not exclude(entry.name))
+                and (include is None or include(entry.name))
+                and (not dirs_only or entry.is_dir())
+            )
+            yield entry, selected
+
+
+def list_entries(
+    path: str,
+    include_re: Union[str, Pattern] = None,
+    exclude_re: Union[str, Pattern] = None,
+    dirs_only: bool = False,
+) -> Tuple[List[str], List[str]]:
+    """
+    Given a path to a directory, return a sorted list of the names of the
+    entries within that directory selected by scan_entries(), and a sorted
+    list of the names of those that weren't.
+    """
     entries: List[str] = []
     excluded: List[str] = []
-    for entry in os.listdir(path):
-        logging.debug("entry='%s'", entry)
-        if exclude_re is not None and re.match(exclude_re, entry):
-            excluded.append(entry)
-            continue
-        if include_re is not None and not re.match(include_re, entry):
-            excluded.append(entry)
-            continue
-        entries.append(entry)
+    for entry, selected in scan_entries(path, include_re, exclude_re, dirs_only):
+        (entries if selected else excluded).append(entry.name)
 
-    return sorted(entries), excluded
+    return sorted(entries), sorted(excluded)
 
 
 # A bit convoluted so that I can define a docstring for the namedtuple.
@@ -76,6 +249,8 @@ class TrackInfo(TrackInfoNT):
     The disc number, track number, and name for a particular track.
     """
 
+    __slots__ = ()
+
 
 def track_basename_for_plex(ti: TrackInfo) -> str:
     """
@@ -88,108 +263,1435 @@ def track_basename_for_plex(ti: TrackInfo) -> str:
     return f"{track_id} - {ti.track_name}"
 
 
-TRACK_PATTERN = re.compile(r"(?:([\d])-)?([\d]+)[\s-]+([\S]?.+)")
+# Matches a track's file name (or its path within its album, if it is in a
+# disc subdirectory), optionally prefixed by a disc number, in any of the
+# forms '1-01 Name', '101 Name', 'CD1/01 Name', 'Disc 2 - 01 Name' and
+# 'Disc 2/01 Name', or just '01 Name'. The track number may be followed by
+# a space, dash, or '. '.
+TRACK_PATTERN = re.compile(
+    r"""
+    (?:
+        (?:cd|dis[ck])\s*(?P<disc>\d+)[\s/_-]*
+      | (?P<dash_disc>\d)-
+    )?
+    (?:
+        (?P<joined_disc>[1-9])(?P<joined_track>(?!00)\d\d)(?=[\s.-])
+      | (?P<track>\d+)
+    )
+    (?:\.\s+|[\s-]+)
+    (?P<name>\S.*)
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+
+# A disc subdirectory of an album, such as 'CD1' or 'Disc 2'.
+DISC_DIR_RE = re.compile(r"(?:cd|dis[ck])\s*\d+", re.IGNORECASE)
+
+ParsedTrack = namedtuple("ParsedTrack", "file_name, info, basename")
 
 
-def extract_track_info(target_track_file_name) -> TrackInfo:
+def parse_track_names(
+    target_track_file_names: Iterable[str],
+) -> Tuple[List[ParsedTrack], List[str]]:
+    """
+    Given the file names (or paths within their album) of an album's target
+    tracks, return, for those that match TRACK_PATTERN, their TrackInfo and
+    link file name appropriate for Plex, and, separately, the names that don't.
+    """
+    match = TRACK_PATTERN.match
+    parsed = []
+    unmatched = []
+    for file_name in target_track_file_names:
+        m = match(file_name)
+        if m is None:
+            unmatched.append(file_name)
+            continue
+        disc, dash_disc, joined_disc, joined_track, track, track_name = m.groups()
+        disc_number = int(disc or dash_disc or joined_disc or 0)
+        track_number = int(joined_track or track)
+        # as track_basename_for_plex() would, without looking up the fields
+        if disc_number > 0:
+            basename = f"{disc_number}{track_number:02} - {track_name}"
+        else:
+            basename = f"{track_number:02} - {track_name}"
+        ti = TrackInfo(disc_number, track_number, track_name)
+        parsed.append(ParsedTrack(file_name, ti, basename))
+    return parsed, unmatched
+
+
+def extract_track_info(target_track_file_name) -> Optional[TrackInfo]:
     """
     Given file name of target track, return the corresponding
-    track number and track name.
+    track number and track name, or None if the file name doesn't
+    match TRACK_PATTERN.
+    """
+    parsed, _ = parse_track_names([target_track_file_name])
+    return parsed[0].info if parsed else None
+
+
+# The tags embedded in a track, as read by read_track_tags(); disc_number
+# and disc_total are 0 if not present.
+TrackTags = namedtuple("TrackTags", "disc_number, disc_total, track_number, title")
+
+# Tag values (titles, track and disc numbers) are short, so no more than
+# this is ever read for one.
+MAX_TAG_VALUE_SIZE = 1024
+
+# The MP4 atoms enclosing the iTunes-style metadata items.
+MP4_ILST_PATH = (b"moov", b"udta", b"meta", b"ilst")
+MP4_TITLE = b"\xa9nam"
+MP4_TRACK = b"trkn"
+MP4_DISC = b"disk"
+
+
+def mp4_atoms(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Given an MP4 file, yield the type, payload start and payload end of each
+    atom between 'start' and 'end'. Only the atom headers are read; payloads
+    (notably the media data) are skipped over.
+    """
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        size, kind = struct.unpack(">I4s", f.read(8))
+        header_size = 8
+        if size == 1:  # 64-bit size follows the type
+            (size,) = struct.unpack(">Q", f.read(8))
+            header_size = 16
+        elif size == 0:  # atom extends to the end of its container
+            size = end - pos
+        if size < header_size:
+            return
+        yield kind, pos + header_size, min(pos + size, end)
+        pos += size
+
+
+def read_mp4_tags(f: BinaryIO, file_size: int) -> Optional[TrackTags]:
+    """
+    Given an MP4 (.m4a) file, return the title, track and disc number from
+    its metadata, or None if it doesn't have them.
+    """
+    start, end = 0, file_size
+    for container in MP4_ILST_PATH:
+        for kind, payload_start, payload_end in mp4_atoms(f, start, end):
+            if kind == container:
+                start, end = payload_start, payload_end
+                break
+        else:
+            return None
+        if container == b"meta":
+            # iTunes 'meta' is a full box (with version and flags before its
+            # children); QuickTime 'meta' isn't, and starts with 'hdlr'
+            f.seek(start + 4)
+            if f.read(4) != b"hdlr":
+                start += 4
+
+    values = {}
+    for kind, payload_start, payload_end in mp4_atoms(f, start, end):
+        if kind not in (MP4_TITLE, MP4_TRACK, MP4_DISC):
+            continue
+        for data_kind, data_start, data_end in mp4_atoms(f, payload_start, payload_end):
+            if data_kind == b"data":
+                f.seek(data_start + 8)  # skip type indicator and locale
+                values[kind] = f.read(
+                    min(data_end - data_start - 8, MAX_TAG_VALUE_SIZE)
+                )
+                break
+
+    if MP4_TITLE not in values or len(values.get(MP4_TRACK, b"")) < 6:
+        return None
+    # 'trkn' and 'disk' are: 2 bytes padding, 2 bytes number, 2 bytes total
+    _, track_number, _ = struct.unpack(">3H", values[MP4_TRACK][:6])
+    disc_number = disc_total = 0
+    if len(values.get(MP4_DISC, b"")) >= 6:
+        _, disc_number, disc_total = struct.unpack(">3H", values[MP4_DISC][:6])
+    title = values[MP4_TITLE].decode("utf-8", errors="replace")
+    return TrackTags(disc_number, disc_total, track_number, title)
+
+
+# ID3v2 text frame ids, by major version, for title, track and disc.
+ID3_FRAME_IDS = {
+    2: (b"TT2", b"TRK", b"TPA"),
+    3: (b"TIT2", b"TRCK", b"TPOS"),
+    4: (b"TIT2", b"TRCK", b"TPOS"),
+}
+ID3_TEXT_ENCODINGS = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}
+ID3_FLAG_UNSYNCHRONISATION = 0x80
+ID3_FLAG_EXTENDED_HEADER = 0x40
+
+
+def syncsafe_int(data: bytes) -> int:
+    """Return the value of an ID3v2 'syncsafe' integer (7 bits per byte)."""
+    value = 0
+    for byte in data:
+        value = (value << 7) | (byte & 0x7F)
+    return value
+
+
+def parse_number_pair(text: str) -> Tuple[int, int]:
+    """
+    Given ID3v2 track or disc text such as '3' or '3/12', return the number
+    and total, either of which is 0 if not present.
+    """
+    number, _, total = text.partition("/")
+    try:
+        return int(number or 0), int(total or 0)
+    except ValueError:
+        return 0, 0
+
+
+def read_id3_tags(f: BinaryIO) -> Optional[TrackTags]:
+    """
+    Given an MP3 file, return the title, track and disc number from its
+    ID3v2 tag, or None if it doesn't have them. Frames other than those
+    wanted (such as cover art) are skipped over rather than read.
+    """
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3" or header[3] not in ID3_FRAME_IDS:
+        return None
+    major, flags = header[3], header[5]
+    if flags & ID3_FLAG_UNSYNCHRONISATION:
+        return None
+    tag_end = 10 + syncsafe_int(header[6:10])
+
+    pos = 10
+    if flags & ID3_FLAG_EXTENDED_HEADER and major >= 3:
+        ext_size = f.read(4)
+        pos += (
+            syncsafe_int(ext_size)
+            if major == 4
+            else 4 + int.from_bytes(ext_size, "big")
+        )
+
+    id_size, header_size = (3, 6) if major == 2 else (4, 10)
+    title_id, track_id, disc_id = ID3_FRAME_IDS[major]
+    values = {}
+    while pos + header_size <= tag_end:
+        f.seek(pos)
+        frame_header = f.read(header_size)
+        frame_id = frame_header[:id_size]
+        if not frame_id.strip(b"\0"):  # padding
+            break
+        size_bytes = frame_header[id_size : id_size * 2]
+        size = (
+            syncsafe_int(size_bytes)
+            if major == 4
+            else int.from_bytes(size_bytes, "big")
+        )
+        if frame_id in (title_id, track_id, disc_id) and size > 1:
+            data = f.read(min(size, MAX_TAG_VALUE_SIZE))
+            if len(data) < 2:  # the file ends before the frame's data
+                break
+            encoding = ID3_TEXT_ENCODINGS.get(data[0], "latin-1")
+            text = data[1:].decode(encoding, errors="replace")
+            values[frame_id] = text.split("\0", maxsplit=1)[0].strip()
+        pos += header_size + size
+
+    if title_id not in values or track_id not in values:
+        return None
+    track_number, _ = parse_number_pair(values[track_id])
+    disc_number, disc_total = parse_number_pair(values.get(disc_id, ""))
+    return TrackTags(disc_number, disc_total, track_number, values[title_id])
+
+
+def read_track_tags(path: str) -> Optional[TrackTags]:
+    """
+    Return the tags embedded in the specified MP4 or MP3 file, or None if
+    it doesn't have them or they can't be read.
+    """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(8)
+            f.seek(0)
+            if magic[:3] == b"ID3":
+                return read_id3_tags(f)
+            if magic[4:8] == b"ftyp":
+                return read_mp4_tags(f, os.fstat(f.fileno()).st_size)
+    except (OSError, struct.error, UnicodeError, IndexError, ValueError) as e:
+        logging.debug("%s: can't read tags: %s", path, e)
+    return None
+
+
+def track_info_from_tags(tags: TrackTags, target_track_file_name: str) -> TrackInfo:
+    """
+    Given the tags of a track, and its file name (for its extension), return
+    the corresponding TrackInfo. The disc number is only used if the album
+    has more than one disc, as with file names.
+    """
+    disc_number = tags.disc_number if max(tags.disc_number, tags.disc_total) > 1 else 0
+    extension = os.path.splitext(target_track_file_name)[1]
+    track_name = tags.title.replace(os.sep, "-") + extension
+    return TrackInfo(disc_number, tags.track_number, track_name)
+
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "link_music"
+)
+CACHE_VERSION = 1
+
+
+class FileCache:
+    """
+    Values derived from files, persisted (as JSON) between runs and keyed by
+    each file's path, size and mtime, so that a file's value is only derived
+    again if it has changed.
+    """
+
+    def __init__(self, path: str, files: Dict[str, list]):
+        self.path = path
+        self.files = files  # path -> [size, mtime_ns, value]
+        self.modified = False
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Return the cache saved at 'path', or an empty cache if there isn't
+        a usable one.
+        """
+        files = {}
+        try:
+            with open(path, encoding="utf-8") as cache_file:
+                cache = json.load(cache_file)
+            if cache.get("version") == CACHE_VERSION:
+                files = cache["files"]
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as e:
+            print_warning(f"{path}: ignoring unreadable cache: {e}")
+        return cls(path, files)
+
+    def lookup(self, file_path: str, stat: os.stat_result) -> Tuple[bool, object]:
+        """
+        Return whether a value is cached for the specified file (as it is
+        now), and if so, the value.
+        """
+        cached = self.files.get(file_path)
+        if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return True, cached[2]
+        return False, None
+
+    def store(self, file_path: str, stat: os.stat_result, value) -> None:
+        """
+        Cache the value for the specified file (as it is now).
+        """
+        # NB: safe to call from several threads, as dict assignment is atomic
+        self.files[file_path] = [stat.st_size, stat.st_mtime_ns, value]
+        self.modified = True
+
+    def save(self) -> None:
+        """
+        Atomically save the cache, if it has been modified.
+        """
+        if not self.modified:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}"
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            json.dump({"version": CACHE_VERSION, "files": self.files}, cache_file)
+        os.replace(temp_path, self.path)
+        self.modified = False
+
+
+TAG_CACHE_PATH = os.path.join(CACHE_DIR, "tags.json")
+
+
+class TagCache(FileCache):
+    """
+    The tags read from tracks (as lists of TrackTags fields, or None).
+    """
+
+    @classmethod
+    def load(cls, path: str = TAG_CACHE_PATH) -> "TagCache":
+        return super().load(path)
+
+    def track_info(self, target_track_path: str) -> Optional[TrackInfo]:
+        """
+        Return the TrackInfo for the specified track derived from its tags,
+        or None if it doesn't have them.
+        """
+        stat = os.stat(target_track_path)
+        cached, tags = self.lookup(target_track_path, stat)
+        if not cached:
+            tags = read_track_tags(target_track_path)
+            self.store(target_track_path, stat, tags)
+        if tags is None:
+            return None
+        return track_info_from_tags(TrackTags(*tags), target_track_path)
+
+
+# Files are first compared by a hash of (at most) this many of their leading
+# bytes, and only hashed in full if those match.
+PARTIAL_HASH_SIZE = 64 * 1024
+HASH_CACHE_PATH = os.path.join(CACHE_DIR, "hashes.json")
+
+
+class HashCache(FileCache):
+    """
+    The partial and full hashes of tracks (as [partial, full] lists,
+    either of which may be None if not yet computed).
     """
-    m = TRACK_PATTERN.match(target_track_file_name)
-    disk_match = m.group(1)
-    disk_number = int(disk_match) if disk_match is not None else 0
-    track_number = int(m.group(2))
-    track_name = m.group(3)
 
-    logging.debug("disk_number=%d", disk_number)
-    logging.debug("track_number=%d", track_number)
-    logging.debug("track_name='%s'", track_name)
+    @classmethod
+    def load(cls, path: str = HASH_CACHE_PATH) -> "HashCache":
+        return super().load(path)
 
-    return TrackInfo(disk_number, track_number, track_name)
 
+def hash_file(file_path: str, partial: bool) -> Optional[str]:
+    """
+    Return the BLAKE2 hash of the specified file (or of its first
+    PARTIAL_HASH_SIZE bytes, if 'partial'), or None if it can't be read.
+    The file is memory-mapped rather than read through a buffer.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return hashlib.blake2b().hexdigest()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                data = m[:PARTIAL_HASH_SIZE] if partial else m
+                return hashlib.blake2b(data).hexdigest()
+    except OSError as e:
+        logging.debug("%s: can't hash: %s", file_path, e)
+        return None
 
-def make_symlink(target_path, link_path: str) -> None:
+
+def hash_files(
+    file_paths: List[str],
+    stats: Dict[str, os.stat_result],
+    partial: bool,
+    hash_cache: HashCache,
+    get_pool: Callable[[], ProcessPoolExecutor],
+) -> Dict[str, str]:
     """
-    Given the path to a symbolic link target, and a path specifying
-    name and location of the symbolic link, write some informational
-    messages to STDOUT and create the symlink.
+    Return the (partial, or full) hash of each of the specified files which
+    can be read, from 'hash_cache' if possible, and otherwise computed in
+    the process pool returned by 'get_pool'.
     """
-    info_link_path = f".../{os.path.basename(link_path)}"
-    info_target_path = f"<ad>/.../{os.path.basename(target_path)}"
-    print(f"    {info_link_path:36} -> {info_target_path:36}")
-    os.symlink(target_path, link_path)
+    index = 0 if partial else 1
+    hashes = {}
+    uncached = []
+    for file_path in file_paths:
+        cached, value = hash_cache.lookup(file_path, stats[file_path])
+        if cached and value[index] is not None:
+            hashes[file_path] = value[index]
+        else:
+            uncached.append(file_path)
+
+    if uncached:
+        pool = get_pool()
+        chunksize = max(1, len(uncached) // (4 * (os.cpu_count() or 1)))
+        computed = pool.map(
+            hash_file, uncached, itertools.repeat(partial), chunksize=chunksize
+        )
+        for file_path, file_hash in zip(uncached, computed):
+            if file_hash is None:
+                print_warning(f"{file_path}: can't read to check for duplicates")
+                continue
+            stat = stats[file_path]
+            cached, value = hash_cache.lookup(file_path, stat)
+            value = list(value) if cached else [None, None]
+            value[index] = file_hash
+            hash_cache.store(file_path, stat, value)
+            hashes[file_path] = file_hash
+    return hashes
 
 
-def symlink_album(target_dir, artist, album: str) -> None:
+def group_by(keys: Dict[str, object]) -> List[List[str]]:
+    """
+    Given a key for each of a number of paths, return the groups of (two or
+    more) paths which have the same key.
+    """
+    groups = defaultdict(list)
+    for file_path, key in keys.items():
+        groups[key].append(file_path)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def find_duplicates(file_paths: List[str], hash_cache: HashCache) -> List[List[str]]:
+    """
+    Return the groups of files, among those specified, with identical
+    contents. Each group is sorted so that its first file, considered the
+    canonical copy, is the one with the shortest path (so, for instance, a
+    track on an album rather than on its "(Deluxe Edition)").
+    Files are bucketed by size, then by partial hash, and only files which
+    still collide are hashed in full, so most files are never read.
+    """
+    stats = {}
+    for file_path in file_paths:
+        try:
+            stats[file_path] = os.stat(file_path)
+        except OSError as e:
+            print_warning(f"{file_path}: {e.strerror}")
+
+    pool = None
+
+    def get_pool() -> ProcessPoolExecutor:
+        nonlocal pool
+        if pool is None:
+            pool = ProcessPoolExecutor()
+        return pool
+
+    try:
+        sizes = {file_path: stat.st_size for file_path, stat in stats.items()}
+        candidates = list(itertools.chain.from_iterable(group_by(sizes)))
+        partial_hashes = hash_files(candidates, stats, True, hash_cache, get_pool)
+        candidates = list(
+            itertools.chain.from_iterable(
+                group_by({p: (sizes[p], h) for p, h in partial_hashes.items()})
+            )
+        )
+        # a file no bigger than PARTIAL_HASH_SIZE has been hashed in full already
+        full_hashes = {
+            p: partial_hashes[p] for p in candidates if sizes[p] <= PARTIAL_HASH_SIZE
+        }
+        candidates = [p for p in candidates if p not in full_hashes]
+        full_hashes.update(hash_files(candidates, stats, False, hash_cache, get_pool))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return sorted(
+        sorted(group, key=lambda p: (len(p), p))
+        for group in group_by({p: (sizes[p], h) for p, h in full_hashes.items()})
+    )
+
+
+def print_duplicates(groups: List[List[str]], out: TextIO = None) -> None:
+    """
+    Write the specified groups of duplicate files to 'out' (STDOUT by default).
+    """
+    for group in groups:
+        print(f"duplicates: {group[0]}", file=out)
+        for file_path in group[1:]:
+            print(f"          = {file_path}", file=out)
+
+
+# What is to be done with an album's link directory.
+DIR_CREATE = "create"  # create it, failing if it already exists
+DIR_ENSURE = "ensure"  # create it if it doesn't already exist
+DIR_REMOVE = "remove"  # remove it, once the links within it have been removed
+
+# What is to be done with a link.
+LINK_CREATE = "create"
+LINK_REPLACE = "replace"  # remove a link to the wrong place and recreate it
+LINK_REMOVE = "remove"
+
+# target_path is None for LINK_REMOVE
+LinkOp = namedtuple("LinkOp", "action, link_name, target_path")
+
+AlbumPlanNT = namedtuple(
+    "AlbumPlan", "album, link_dir, dir_action, ops, links, skipped, clashes"
+)
+
+
+class AlbumPlan(AlbumPlanNT):
+    """
+    Everything to be done for an album: its name, its link directory and
+    what is to be done with it, the LinkOps to be applied within it, the link
+    name of each track (for the manifest), the track entries skipped, and
+    the tracks skipped because their link name is already taken by another
+    (as (track, link name, other track) tuples).
+    """
+
+
+# How tracks are "linked" into the link directories: reflinks and hard links
+# fall back on copying (within the kernel, where possible) when they can't
+# be made, such as across filesystems.
+LINK_MODE_SYMLINK = "symlink"
+LINK_MODE_HARDLINK = "hardlink"
+LINK_MODE_REFLINK = "reflink"
+
+# ioctl() request to share the extents of a file with another (Linux)
+FICLONE = 0x40049409
+# errors meaning that a hard link, reflink or zero-copy copy isn't possible
+# (rather than that something is actually wrong)
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EMLINK,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.ENOTSOCK,
+}
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def link_exists(link_path: str, link_mode: str) -> bool:
+    """
+    Return whether there is a link (of the kind made in 'link_mode') at
+    'link_path'.
+    """
+    if link_mode == LINK_MODE_SYMLINK:
+        return os.path.islink(link_path)
+    return os.path.isfile(link_path) and not os.path.islink(link_path)
+
+
+def link_is_current(link_path, target_path, link_mode: str) -> Optional[bool]:
+    """
+    Return whether the link at 'link_path' is (still) the one to make for
+    'target_path' in 'link_mode', or None if there is nothing at 'link_path'.
+    A hard link, reflink or copy is current if it has the same size and mtime
+    as its target, as its mtime is set to the target's when it is made.
+    """
+    try:
+        if link_mode == LINK_MODE_SYMLINK:
+            return os.readlink(link_path) == target_path
+        link_stat = os.lstat(link_path)
+    except FileNotFoundError:
+        return None
+    except OSError:  # not a symlink
+        return False
+    if not S_ISREG(link_stat.st_mode):
+        return False
+    target_stat = os.stat(target_path)
+    return (link_stat.st_size, link_stat.st_mtime_ns) == (
+        target_stat.st_size,
+        target_stat.st_mtime_ns,
+    )
+
+
+def copy_file_range_all(src_fd: int, dst_fd: int, size: int) -> None:
+    """Copy 'size' bytes from 'src_fd' to 'dst_fd' with copy_file_range()."""
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)
+        if copied == 0:
+            break
+        offset += copied
+
+
+def sendfile_all(src_fd: int, dst_fd: int, size: int) -> None:
+    """Copy 'size' bytes from 'src_fd' to 'dst_fd' with sendfile()."""
+    os.lseek(dst_fd, 0, os.SEEK_SET)
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+        if sent == 0:
+            break
+        offset += sent
+
+
+def read_write_all(src_fd: int, dst_fd: int, size: int) -> None:
+    """Copy 'size' bytes from 'src_fd' to 'dst_fd' with pread() and pwrite()."""
+    offset = 0
+    while offset < size:
+        data = os.pread(src_fd, min(COPY_BUFFER_SIZE, size - offset), offset)
+        if not data:
+            break
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(dst_fd, view, offset)
+            view = view[written:]
+            offset += written
+
+
+def copy_file_data(src_fd: int, dst_fd: int, size: int) -> None:
+    """
+    Copy 'size' bytes from 'src_fd' to 'dst_fd', within the kernel (with
+    copy_file_range(), or else sendfile()) if possible, and otherwise by
+    reading and writing.
+    """
+    for name, copy_all in (
+        ("copy_file_range", copy_file_range_all),
+        ("sendfile", sendfile_all),
+    ):
+        if not hasattr(os, name):
+            continue
+        try:
+            copy_all(src_fd, dst_fd, size)
+            return
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+            logging.debug("%s() not possible: %s", name, e)
+    read_write_all(src_fd, dst_fd, size)
+
+
+def reflink(src_fd: int, dst_fd: int) -> bool:
+    """
+    Make 'dst_fd' share the (copy-on-write) extents of 'src_fd', if the
+    filesystem supports it, returning whether it does.
+    """
+    if fcntl is None or not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as e:
+        if e.errno not in UNSUPPORTED_ERRNOS:
+            raise
+        logging.debug("FICLONE not possible: %s", e)
+        return False
+    return True
+
+
+def clone_file(target_path, link_name: str, dir_fd: int) -> None:
+    """
+    Make 'link_name' (relative to 'dir_fd') a reflink to 'target_path', if
+    possible, and otherwise a copy of it. Either way, its mtime is set to
+    that of 'target_path'.
+    """
+    with open(target_path, "rb") as target_file:
+        src_fd = target_file.fileno()
+        src_stat = os.fstat(src_fd)
+        dst_fd = os.open(
+            link_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644, dir_fd=dir_fd
+        )
+        try:
+            if not reflink(src_fd, dst_fd):
+                copy_file_data(src_fd, dst_fd, src_stat.st_size)
+            os.utime(dst_fd, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        except BaseException:
+            os.close(dst_fd)
+            os.unlink(link_name, dir_fd=dir_fd)
+            raise
+        os.close(dst_fd)
+
+
+def make_link(target_path, link_name: str, dir_fd: int, link_mode: str) -> None:
+    """
+    Make 'link_name' (relative to 'dir_fd') a link to 'target_path' of the
+    kind specified by 'link_mode'.
+    """
+    if link_mode == LINK_MODE_SYMLINK:
+        os.symlink(target_path, link_name, dir_fd=dir_fd)
+        return
+    if link_mode == LINK_MODE_HARDLINK:
+        try:
+            os.link(target_path, link_name, dst_dir_fd=dir_fd)
+            return
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRNOS:
+                raise
+    clone_file(target_path, link_name, dir_fd)
+
+
+def plan_album(
+    target_dir,
+    artist,
+    album: str,
+    old_links: Dict[str, str] = None,
+    tag_cache: TagCache = None,
+    canonical_paths: Dict[str, str] = None,
+    link_mode: str = LINK_MODE_SYMLINK,
+    old_link_mode: str = LINK_MODE_SYMLINK,
+) -> AlbumPlan:
     """
     Given a symlink target directory, an artist, and an album subdirectory,
-    return a list of SymlinkArgs corresponding to the tracks within that album.
+    return the plan for linking the album's tracks. If 'old_links' (the links
+    created by a previous run) are provided, the album's link directory may
+    already exist, and only links which are missing or point elsewhere are
+    to be (re)created, and links which are no longer wanted removed.
+    If 'tag_cache' is provided, tracks are named from their embedded tags
+    where possible, rather than from their file names. Tracks which can't
+    be named either way are skipped, as are tracks which would be given the
+    same link name as another. If 'canonical_paths' is provided, tracks
+    which are duplicates are linked to the canonical copy instead.
+    Links are of the kind specified by 'link_mode'; the old links, which
+    are removed, are of the kind specified by 'old_link_mode'.
     """
-    print(f"linking  album: {album}")
     album_link_subdir = os.path.join(artist, album)
-    os.makedirs(album_link_subdir, mode=0o755, exist_ok=False)
-
     album_target_subdir = os.path.join(target_dir, album)
 
-    target_track_basenames, excluded_entries = list_entries(
-        album_target_subdir, include_re=r".+(\.m4a|\.mp3)"
-    )
-    for target_track_basename in target_track_basenames:
-        ti = extract_track_info(target_track_basename)
-        link_track_basename = track_basename_for_plex(ti)
+    with metrics.timed("scan"):
+        target_track_basenames, skipped = list_album_entries(album_target_subdir)
+    with metrics.timed("parse"):
+        link_basenames = {}
+        if tag_cache is not None:
+            for target_track_basename in target_track_basenames:
+                target_track_path = os.path.join(
+                    album_target_subdir, target_track_basename
+                )
+                ti = tag_cache.track_info(target_track_path)
+                if ti is not None:
+                    link_basenames[target_track_basename] = track_basename_for_plex(ti)
+        parsed, unmatched = parse_track_names(
+            b for b in target_track_basenames if b not in link_basenames
+        )
+        link_basenames.update((p.file_name, p.basename) for p in parsed)
+        skipped += unmatched
+        links = {}
+        clashes = []
+        linked_names = {}
+        for target_track_basename in target_track_basenames:
+            link_name = link_basenames.get(target_track_basename)
+            if link_name is None:
+                continue
+            if link_name in linked_names:
+                clashes.append(
+                    (target_track_basename, link_name, linked_names[link_name])
+                )
+                continue
+            linked_names[link_name] = target_track_basename
+            links[target_track_basename] = link_name
+    metrics.count("tracks", len(links))
+    metrics.count("skipped_entries", len(skipped) + len(clashes))
 
+    target_paths = {}
+    for target_track_basename in links:
         target_track_path = os.path.join(album_target_subdir, target_track_basename)
-        link_track_path = os.path.join(artist, album, link_track_basename)
+        if canonical_paths is not None:
+            target_track_path = canonical_paths.get(
+                target_track_path, target_track_path
+            )
+        target_paths[target_track_basename] = target_track_path
+
+    if old_links is None:
+        ops = [
+            LinkOp(LINK_CREATE, link_name, target_paths[target])
+            for target, link_name in links.items()
+        ]
+        return AlbumPlan(
+            album, album_link_subdir, DIR_CREATE, ops, links, skipped, clashes
+        )
+
+    ops = [
+        LinkOp(LINK_REMOVE, link_name, None)
+        for link_name in sorted(set(old_links.values()) - set(links.values()))
+        if link_exists(os.path.join(album_link_subdir, link_name), old_link_mode)
+    ]
+    for target_track_basename, link_name in links.items():
+        target_track_path = target_paths[target_track_basename]
+        link_track_path = os.path.join(album_link_subdir, link_name)
+        current = link_is_current(link_track_path, target_track_path, link_mode)
+        if current is None:
+            ops.append(LinkOp(LINK_CREATE, link_name, target_track_path))
+        elif not current:
+            ops.append(LinkOp(LINK_REPLACE, link_name, target_track_path))
+    return AlbumPlan(album, album_link_subdir, DIR_ENSURE, ops, links, skipped, clashes)
+
+
+def plan_album_removal(
+    artist, album: str, old_links: Dict[str, str], link_mode: str = LINK_MODE_SYMLINK
+) -> AlbumPlan:
+    """
+    Return the plan for removing the links (of the kind specified by
+    'link_mode') created for an album that no longer exists, and then the
+    album's link directory.
+    """
+    album_link_subdir = os.path.join(artist, album)
+    ops = [
+        LinkOp(LINK_REMOVE, link_name, None)
+        for link_name in sorted(old_links.values())
+        if link_exists(os.path.join(album_link_subdir, link_name), link_mode)
+    ]
+    return AlbumPlan(album, album_link_subdir, DIR_REMOVE, ops, {}, [], [])
 
-        make_symlink(target_track_path, link_track_path)
+
+PLAN_HEADINGS = {
+    DIR_CREATE: "linking  album",
+    DIR_ENSURE: "syncing  album",
+    DIR_REMOVE: "removing album",
+}
+
+
+def print_plan(plan: AlbumPlan, out: TextIO = None, err: TextIO = None) -> None:
+    """
+    Write the specified plan to 'out', and warnings about the entries it
+    skipped to 'err' (STDOUT and STDERR by default). Nothing is written for
+    an album being synced that needs nothing done.
+    """
+    if (
+        plan.dir_action == DIR_ENSURE
+        and not plan.ops
+        and not plan.skipped
+        and not plan.clashes
+    ):
+        return
+    print(f"{PLAN_HEADINGS[plan.dir_action]}: {plan.album}", file=out)
+    for op in plan.ops:
+        info_link_path = f".../{op.link_name}"
+        if op.action != LINK_CREATE:
+            print(f"    {info_link_path:36} removed", file=out)
+        if op.action != LINK_REMOVE:
+            info_target_path = f"<ad>/.../{os.path.basename(op.target_path)}"
+            print(f"    {info_link_path:36} -> {info_target_path:36}", file=out)
     # let user know what files we skipped
-    for excluded_entry in excluded_entries:
-        print_warning(f"skipped unmatched file '{excluded_entry}'")
+    for skipped_entry in plan.skipped:
+        print_warning(f"skipped unmatched file '{skipped_entry}'", err)
+    for track, link_name, other_track in plan.clashes:
+        print_warning(
+            f"skipped '{track}': its link name '{link_name}' "
+            f"is taken by '{other_track}'",
+            err,
+        )
 
 
-def main() -> int:
+def execute_plan(plan: AlbumPlan, link_mode: str = LINK_MODE_SYMLINK) -> None:
     """
-    Main for this script.
+    Apply the specified plan, making links of the kind specified by
+    'link_mode'. The links are created and removed relative to a descriptor
+    for the album's link directory, so that its path is resolved once per
+    album rather than once per track.
     """
-    logging.debug("TRACK_RE=%s", TRACK_PATTERN)
+    if plan.dir_action != DIR_REMOVE:
+        with metrics.timed("mkdir"):
+            os.makedirs(
+                plan.link_dir, mode=0o755, exist_ok=plan.dir_action == DIR_ENSURE
+            )
+    elif not os.path.isdir(plan.link_dir):
+        return
+
+    with metrics.timed("link"):
+        dir_fd = os.open(plan.link_dir, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            for op in plan.ops:
+                if op.action != LINK_CREATE:
+                    os.unlink(op.link_name, dir_fd=dir_fd)
+                if op.action != LINK_REMOVE:
+                    make_link(op.target_path, op.link_name, dir_fd, link_mode)
+                metrics.count(f"links_{op.action}")
+        finally:
+            os.close(dir_fd)
 
-    if len(sys.argv) != 2:
-        print_warning(f"usage: {program} <artist_directory>")
-        return 1
+    if plan.dir_action == DIR_REMOVE:
+        os.rmdir(plan.link_dir)
 
-    artist_target_dir = os.path.abspath(os.path.expanduser(sys.argv[1]))
-    # target_dir = os.path.abspath(sys.argv[2])
 
-    valid, error_message = check_directory(artist_target_dir)
-    if not valid:
-        print_warning(error_message)
-        return 1
+# The manifest, kept in each artist's link directory, records for each album
+# the source directory's mtime and inode, the link directory's mtime, and the
+# links created, so that --sync can skip albums that haven't changed.
+MANIFEST_NAME = ".link_music.json"
+MANIFEST_VERSION = 1
 
+AlbumSource = namedtuple("AlbumSource", "name, mtime_ns, ino")
+
+
+def load_manifest(artist, artist_target_dir: str) -> Dict[str, dict]:
+    """
+    Return the albums recorded in the manifest of the specified artist's
+    link directory, or an empty dict if there is no usable manifest.
+    """
+    manifest_path = os.path.join(artist, MANIFEST_NAME)
+    try:
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print_warning(f"{manifest_path}: ignoring unreadable manifest: {e}")
+        return {}
+
+    if (
+        manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("target_dir") != artist_target_dir
+    ):
+        return {}
+    return manifest.get("albums", {})
+
+
+def save_manifest(artist, artist_target_dir: str, albums: Dict[str, dict]) -> None:
+    """
+    Atomically replace the manifest of the specified artist's link directory.
+    """
+    manifest_path = os.path.join(artist, MANIFEST_NAME)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "target_dir": artist_target_dir,
+        "albums": dict(sorted(albums.items())),
+    }
+    temp_path = f"{manifest_path}.{os.getpid()}"
+    with open(temp_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(temp_path, manifest_path)
+
+
+def entry_link_mode(entry: dict) -> str:
+    """
+    Return the kind of link recorded in a manifest entry (entries written
+    before links could be anything else are of symlinks).
+    """
+    return entry.get("link_mode", LINK_MODE_SYMLINK)
+
+
+def album_unchanged(
+    artist: str, source: AlbumSource, entry: dict, link_mode: str
+) -> bool:
+    """
+    Return whether neither an album's source directory nor its link directory
+    have changed since the manifest 'entry' was recorded (with links of the
+    kind specified by 'link_mode'). (Adding, removing or renaming an entry in
+    a directory updates its mtime.)
+    """
+    if entry is None or entry_link_mode(entry) != link_mode:
+        return False
+    if entry["mtime_ns"] != source.mtime_ns or entry["ino"] != source.ino:
+        return False
+    # changes within disc subdirectories don't update the album's mtime
+    for disc_dir, disc_mtime_ns in entry.get("disc_mtimes", {}).items():
+        disc_target_subdir = os.path.join(entry["target_dir"], disc_dir)
+        try:
+            if os.stat(disc_target_subdir).st_mtime_ns != disc_mtime_ns:
+                return False
+        except FileNotFoundError:
+            return False
+    try:
+        link_mtime_ns = os.stat(os.path.join(artist, source.name)).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    return link_mtime_ns == entry["link_mtime_ns"]
+
+
+# 'old_links' is None unless an album is being synced, in which case
+# 'old_link_mode' is the kind of link they are.
+AlbumJob = namedtuple(
+    "AlbumJob", "target_dir, artist, source, old_links, old_link_mode"
+)
+# 'manifest_entry' is None if the album couldn't be linked.
+AlbumResult = namedtuple("AlbumResult", "album, output, warnings, manifest_entry")
+
+
+def run_album_job(
+    job: AlbumJob,
+    dry_run: bool = False,
+    tag_cache: TagCache = None,
+    canonical_paths: Dict[str, str] = None,
+    link_mode: str = LINK_MODE_SYMLINK,
+) -> AlbumResult:
+    """
+    Plan and (unless 'dry_run') execute the linking (or syncing) of the album
+    described by 'job', buffering its messages so that albums linked
+    concurrently don't interleave their output. Tracks are named from their
+    tags if 'tag_cache' is provided, and duplicates linked to their canonical
+    copies if 'canonical_paths' is. Links are of the kind specified by
+    'link_mode'.
+    """
+    start = time.perf_counter()
+    out = io.StringIO()
+    err = io.StringIO()
+    album = job.source.name
+    manifest_entry = None
+    try:
+        plan = plan_album(
+            job.target_dir,
+            job.artist,
+            album,
+            job.old_links,
+            tag_cache,
+            canonical_paths,
+            link_mode,
+            job.old_link_mode,
+        )
+        print_plan(plan, out, err)
+        link_mtime_ns = None
+        if not dry_run:
+            execute_plan(plan, link_mode)
+            link_mtime_ns = os.stat(plan.link_dir).st_mtime_ns
+        manifest_entry = {
+            "mtime_ns": job.source.mtime_ns,
+            "ino": job.source.ino,
+            "link_mtime_ns": link_mtime_ns,
+            "link_mode": link_mode,
+            "links": plan.links,
+        }
+        disc_dirs = {b.split("/")[0] for b in plan.links if "/" in b}
+        if disc_dirs:
+            album_target_subdir = os.path.join(job.target_dir, album)
+            manifest_entry["target_dir"] = album_target_subdir
+            manifest_entry["disc_mtimes"] = {
+                d: os.stat(os.path.join(album_target_subdir, d)).st_mtime_ns
+                for d in sorted(disc_dirs)
+            }
+    except Exception as e:  # one bad album mustn't abort the whole library
+        print_warning(f"{job.artist}/{album}: {e}", err)
+        metrics.count("failed_albums")
+    metrics.count("albums")
+    metrics.add_album_latency(
+        os.path.join(job.target_dir, album), time.perf_counter() - start
+    )
+    return AlbumResult(album, out.getvalue(), err.getvalue(), manifest_entry)
+
+
+def list_album_entries(album_target_subdir: str) -> Tuple[List[str], List[str]]:
+    """
+    Given an album directory, return a sorted list of the names of the tracks
+    within it, and within any disc subdirectories (as paths relative to the
+    album directory, such as 'CD1/01 Name.m4a'), and a sorted list of the
+    names of the other entries.
+    """
+    track_basenames: List[str] = []
+    excluded: List[str] = []
+    for entry, selected in scan_entries(album_target_subdir, include_re=TRACK_FILES_RE):
+        if selected:
+            track_basenames.append(entry.name)
+        elif DISC_DIR_RE.fullmatch(entry.name) and entry.is_dir():
+            disc_track_basenames, disc_excluded = list_entries(
+                entry.path, include_re=TRACK_FILES_RE
+            )
+            track_basenames += [f"{entry.name}/{b}" for b in disc_track_basenames]
+            excluded += [f"{entry.name}/{b}" for b in disc_excluded]
+        else:
+            excluded.append(entry.name)
+
+    return sorted(track_basenames), sorted(excluded)
+
+
+def list_album_tracks(album_target_subdir: str) -> List[str]:
+    """
+    Return the paths of the tracks within the specified album directory.
+    """
+    try:
+        track_basenames, _ = list_album_entries(album_target_subdir)
+    except OSError as e:
+        print_warning(f"{album_target_subdir}: {e.strerror}")
+        return []
+    return [os.path.join(album_target_subdir, b) for b in track_basenames]
+
+
+def list_albums(
+    artist_target_dir: str,
+) -> Optional[Tuple[List[AlbumSource], List[str]]]:
+    """
+    Given an artist directory, return its album subdirectories, sorted,
+    along with their mtimes and inodes, in a single scandir() pass.
+    The names of any other entries (apart from EXCLUDE_ENTRIES_RE) are
+    returned too, so that they can be reported. None is returned (after
+    a warning) if the artist directory can't be read.
+    """
+    albums = []
+    skipped = []
+    with metrics.timed("scan"):
+        try:
+            for entry, selected in scan_entries(
+                artist_target_dir, exclude_re=EXCLUDE_ENTRIES_RE, dirs_only=True
+            ):
+                if selected:
+                    stat = entry.stat()
+                    albums.append(
+                        AlbumSource(entry.name, stat.st_mtime_ns, stat.st_ino)
+                    )
+                elif not EXCLUDE_ENTRIES_RE.match(entry.name):
+                    skipped.append(entry.name)
+        except OSError as e:
+            print_warning(f"{artist_target_dir}: {e.strerror}")
+            return None
+    metrics.count("artists")
+    return sorted(albums), sorted(skipped)
+
+
+DUPLICATES_REPORT = "report"
+DUPLICATES_LINK = "link"
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """
+    Given command-line arguments, return the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="""\
+            Given one or more artist directories containing albums and tracks,
+            create a mirroring hierarchy of symlinks under the current directory,
+            but where the track names have been transformed to suit Plex.
+            """,
+    )
+    parser.add_argument(
+        "artist_directory",
+        nargs="*",
+        help="an artist directory containing album subdirectories",
+    )
+    parser.add_argument(
+        "-l",
+        "--library",
+        metavar="library_directory",
+        help="mirror every artist directory within library_directory",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"""specify the number of albums linked concurrently.
+        The default is {DEFAULT_JOBS}.""",
+    )
+    parser.add_argument(
+        "-s",
+        "--sync",
+        action="store_true",
+        help=f"""update existing artist link directories rather than refusing
+        to, creating, repairing or removing only the links for albums that have
+        changed since the last run (as recorded in {MANIFEST_NAME})""",
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        action="store_true",
+        help="print what would be linked (or removed), without changing anything",
+    )
+    parser.add_argument(
+        "-t",
+        "--tags",
+        action="store_true",
+        help=f"""name tracks from the title, track and disc number tags embedded
+        in them, falling back on their file names. Tags are cached in
+        {TAG_CACHE_PATH}, so a track's are only read again if it changes.""",
+    )
+    parser.add_argument(
+        "-m",
+        "--link-mode",
+        choices=[LINK_MODE_SYMLINK, LINK_MODE_HARDLINK, LINK_MODE_REFLINK],
+        default=LINK_MODE_SYMLINK,
+        help=f"""specify how tracks are linked. Hard links and reflinks
+        (copy-on-write clones, on filesystems such as Btrfs and XFS) fall back
+        on copying where they can't be made. The default is {LINK_MODE_SYMLINK}.""",
+    )
+    parser.add_argument(
+        "--stats-json",
+        metavar="stats_file",
+        help="""write counts, per-phase timings (scan, parse, mkdir, link,
+        duplicates), album latencies and the slowest albums to stats_file,
+        as JSON""",
+    )
+    parser.add_argument(
+        "-d",
+        "--duplicates",
+        choices=[DUPLICATES_REPORT, DUPLICATES_LINK],
+        help=f"""find tracks with identical contents across all the albums being
+        mirrored, and either report them, or link them all to one canonical copy.
+        Tracks' hashes are cached in {HASH_CACHE_PATH}.""",
+    )
+
+    args = parser.parse_args(argv)
+    logging.debug("args=%s", args)
+
+    if not args.artist_directory and args.library is None:
+        parser.error("specify at least one artist_directory, or --library")
+    if args.jobs < 1:
+        parser.error("number of jobs must be at least 1")
+
+    return args
+
+
+def find_artist_dirs(args: argparse.Namespace) -> Tuple[List[str], bool]:
+    """
+    Return the absolute paths of the artist directories to be mirrored, and
+    whether they were all valid; invalid directories are reported and omitted.
+    """
+    all_valid = True
+    candidates = [os.path.abspath(os.path.expanduser(d)) for d in args.artist_directory]
+    if args.library is not None:
+        library_dir = os.path.abspath(os.path.expanduser(args.library))
+        valid, error_message = check_directory(library_dir)
+        if valid:
+            artists, _ = list_entries(
+                library_dir, exclude_re=EXCLUDE_ENTRIES_RE, dirs_only=True
+            )
+            candidates += [os.path.join(library_dir, artist) for artist in artists]
+        else:
+            print_warning(error_message)
+            all_valid = False
+
+    artist_dirs = []
+    for artist_target_dir in candidates:
+        valid, error_message = check_directory(artist_target_dir)
+        if not valid:
+            print_warning(error_message)
+            all_valid = False
+            continue
+        artist_dirs.append(artist_target_dir)
+
+    return artist_dirs, all_valid
+
+
+# The number of album jobs for an artist, the manifest entries of the albums
+# which are unchanged, and the plans for removing albums which have gone.
+ArtistWork = namedtuple(
+    "ArtistWork", "artist, target_dir, num_jobs, manifest_albums, removal_plans"
+)
+
+
+def plan_artist(
+    artist_target_dir: str,
+    albums: List[AlbumSource],
+    sync,
+    dry_run: bool,
+    skip_unchanged: bool = True,
+    link_mode: str = LINK_MODE_SYMLINK,
+) -> Tuple[ArtistWork, List[AlbumJob]]:
+    """
+    Create the artist's link directory (if need be, and unless 'dry_run'),
+    and return what is to be done for the artist, and the jobs for its
+    albums. None is returned for the work if the artist's link directory
+    can't be created. When syncing, albums which are unchanged since the
+    last run are skipped, unless not 'skip_unchanged'.
+    """
     artist = os.path.basename(artist_target_dir)
-    print(f"linking artist: {artist}")
     try:
-        os.makedirs(artist, mode=0o755, exist_ok=False)
+        if not dry_run:
+            os.makedirs(artist, mode=0o755, exist_ok=sync)
+        elif not sync and os.path.lexists(artist):
+            raise FileExistsError
     except FileExistsError:
-        print_warning("file or directory already exists")
-        return 1
+        print_warning(f"{artist}: file or directory already exists")
+        return None, []
+    except OSError as e:
+        print_warning(f"{artist}: {e.strerror}")
+        return None, []
+
+    old_albums = load_manifest(artist, artist_target_dir) if sync else {}
+    manifest_albums = {}
+    jobs = []
+    for source in albums:
+        entry = old_albums.get(source.name)
+        if (
+            sync
+            and skip_unchanged
+            and album_unchanged(artist, source, entry, link_mode)
+        ):
+            manifest_albums[source.name] = entry
+            continue
+        old_links = (entry["links"] if entry else {}) if sync else None
+        old_link_mode = entry_link_mode(entry) if entry else link_mode
+        jobs.append(
+            AlbumJob(artist_target_dir, artist, source, old_links, old_link_mode)
+        )
+
+    album_names = {source.name for source in albums}
+    removal_plans = [
+        plan_album_removal(artist, name, entry["links"], entry_link_mode(entry))
+        for name, entry in sorted(old_albums.items())
+        if name not in album_names
+    ]
+    work = ArtistWork(
+        artist, artist_target_dir, len(jobs), manifest_albums, removal_plans
+    )
+    return work, jobs
+
+
+def save_cache(cache: FileCache) -> None:
+    """
+    Save the specified cache, warning (only) if it can't be.
+    """
+    try:
+        cache.save()
+    except OSError as e:
+        print_warning(f"{cache.path}: can't save cache: {e.strerror}")
+
+
+def main() -> int:
+    """
+    Main for this script.
+    """
+    logging.debug("TRACK_RE=%s", TRACK_PATTERN)
+
+    args = parse_args(sys.argv[1:])
+    artist_target_dirs, status_ok = find_artist_dirs(args)
+
+    # Albums (and, before them, the artist directories' album lists) are
+    # processed by a pool of threads, and so with a bounded number of
+    # filesystem operations in flight. Results are reported in order.
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        album_lists = executor.map(list_albums, artist_target_dirs)
+
+        artists = []
+        album_jobs = []
+        album_target_subdirs = []
+        for artist_target_dir, album_list in zip(artist_target_dirs, album_lists):
+            if album_list is None:
+                status_ok = False
+                continue
+            albums, skipped = album_list
+            for name in skipped:
+                print_warning(
+                    f"{os.path.basename(artist_target_dir)}: "
+                    f"skipped non-directory '{name}'"
+                )
+            # unchanged albums must be relinked if their duplicates may have changed
+            work, jobs = plan_artist(
+                artist_target_dir,
+                albums,
+                args.sync,
+                args.dry_run,
+                skip_unchanged=args.duplicates != DUPLICATES_LINK,
+                link_mode=args.link_mode,
+            )
+            if work is None:
+                status_ok = False
+                continue
+            artists.append(work)
+            album_jobs += jobs
+            album_target_subdirs += [
+                os.path.join(artist_target_dir, source.name) for source in albums
+            ]
+
+        duplicates = []
+        canonical_paths = None
+        if args.duplicates is not None:
+            track_paths = itertools.chain.from_iterable(
+                executor.map(list_album_tracks, album_target_subdirs)
+            )
+            hash_cache = HashCache.load()
+            with metrics.timed("duplicates"):
+                duplicates = find_duplicates(list(track_paths), hash_cache)
+            metrics.count("duplicate_tracks", sum(len(g) - 1 for g in duplicates))
+            save_cache(hash_cache)
+        if args.duplicates == DUPLICATES_LINK:
+            canonical_paths = {
+                file_path: group[0] for group in duplicates for file_path in group[1:]
+            }
+
+        tag_cache = TagCache.load() if args.tags else None
+        album_results = executor.map(
+            functools.partial(
+                run_album_job,
+                dry_run=args.dry_run,
+                tag_cache=tag_cache,
+                canonical_paths=canonical_paths,
+                link_mode=args.link_mode,
+            ),
+            album_jobs,
+        )
+        albums_done = 0
+        for work in artists:
+            if work.num_jobs or work.removal_plans or not args.sync:
+                print(f"linking artist: {work.artist}")
+            for plan in work.removal_plans:
+                print_plan(plan)
+                if args.dry_run:
+                    continue
+                try:
+                    execute_plan(plan, args.link_mode)
+                except OSError as e:
+                    print_warning(f"{plan.link_dir}: {e.strerror}")
+                    status_ok = False
+            for _ in range(work.num_jobs):
+                result = next(album_results)
+                sys.stdout.write(result.output)
+                sys.stderr.write(result.warnings)
+                albums_done += 1
+                metrics.report_progress(albums_done, len(album_jobs))
+                if result.manifest_entry is None:
+                    status_ok = False
+                    continue
+                work.manifest_albums[result.album] = result.manifest_entry
+            if not args.dry_run:
+                save_manifest(work.artist, work.target_dir, work.manifest_albums)
+
+    if tag_cache is not None:
+        save_cache(tag_cache)
+    print_duplicates(duplicates)
 
-    album_subdirs, _ = list_entries(artist_target_dir, exclude_re=r"\.DS_Store")
-    for album in album_subdirs:
-        symlink_album(artist_target_dir, artist, album)
+    if args.stats_json is not None:
+        try:
+            with open(args.stats_json, "w", encoding="utf-8") as stats_file:
+                json.dump(metrics.to_dict(), stats_file, indent=2)
+                stats_file.write("\n")
+        except OSError as e:
+            print_warning(f"{args.stats_json}: {e.strerror}")
+            status_ok = False
 
-    return 0
+    return 0 if status_ok else 1
 
 
 program: str = ""  # set below
 
 
-def print_warning(message: str) -> None:
+def print_warning(message: str, file: TextIO = None) -> None:
     """
-    Print the specifed message to standard error, prefixed with
-    the program name.
+    Print the specifed message to 'file' (standard error by default),
+    prefixed with the program name.
     """
-    print(f"{program}: {message}'", file=sys.stderr)
+    print(f"{program}: {message}", file=file if file is not None else sys.stderr)
 
 
 if __name__ == "__main__":
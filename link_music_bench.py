@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+"""
+Benchmark link_music.py's track name parsing (the throughput, in names per
+second, of parsing a synthetic corpus of track file names one at a time, an
+album at a time and in a single batch), comparing the results against a saved
+JSON baseline so that changes which make it slower can be caught.
+"""
+
+import argparse
+import logging
+import os.path
+import random
+import sys
+
+program: str = ""
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+
+sys.path.insert(0, SCRIPT_DIR)
+from bench_harness import best_time, make_parser, report  # noqa: E402
+import link_music  # noqa: E402
+
+DEFAULT_BASELINE = "link_music_bench.json"
+DEFAULT_REPEATS = 3
+DEFAULT_CORPUS_SIZE = 1_000_000
+CORPUS_SEED = 1729
+TRACKS_PER_ALBUM = 12
+
+WORDS = ["love", "the", "night", "blue", "song", "of", "river", "home", "fire", "a"]
+
+# The forms of track file name in the corpus, given the disc number, track
+# number and name; None for the disc means that the form has no disc number,
+# and None for both that the name isn't expected to match.
+TRACK_NAME_FORMS = [
+    (lambda d, t, n: f"{t:02} {n}.m4a", False),
+    (lambda d, t, n: f"{t:02} - {n}.mp3", False),
+    (lambda d, t, n: f"{t:02}. {n}.m4a", False),
+    (lambda d, t, n: f"{d}-{t:02} {n}.m4a", True),
+    (lambda d, t, n: f"{d}{t:02} {n}.mp3", True),
+    (lambda d, t, n: f"CD{d}/{t:02} {n}.m4a", True),
+    (lambda d, t, n: f"Disc {d} - {t:02} {n}.mp3", True),
+    (lambda d, t, n: f"{n}.m4a", None),
+]
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    """
+    Given command-line arguments, return the parsed arguments.
+    """
+    parser = make_parser(
+        """\
+            Benchmark link_music.py's track name parsing and compare the
+            results against a baseline previously saved by this program.
+            The exit status is 1 if any result is worse than the baseline
+            by more than the tolerance.
+            """,
+        DEFAULT_BASELINE,
+        DEFAULT_REPEATS,
+    )
+    parser.add_argument(
+        "-c",
+        "--corpus-size",
+        type=int,
+        default=DEFAULT_CORPUS_SIZE,
+        help=f"""specify the number of track file names in the corpus.
+        The default is {DEFAULT_CORPUS_SIZE}.""",
+    )
+
+    args = parser.parse_args(argv)
+    logging.debug("args=%s", args)
+    return args
+
+
+def make_corpus(size: int) -> tuple[list[str], list[tuple[int, int] | None]]:
+    """
+    Return a reproducible corpus of 'size' track file names, in all the
+    TRACK_NAME_FORMS, along with the (disc number, track number) expected
+    for each, or None if it isn't expected to match.
+    """
+    rng = random.Random(CORPUS_SEED)
+    names = []
+    expected = []
+    for i in range(size):
+        form, has_disc = TRACK_NAME_FORMS[i % len(TRACK_NAME_FORMS)]
+        disc = rng.randint(1, 9)
+        track = rng.randint(1, 99)
+        name = " ".join(rng.choices(WORDS, k=rng.randint(1, 4))).title()
+        names.append(form(disc, track, name))
+        if has_disc is None:
+            expected.append(None)
+        else:
+            expected.append((disc if has_disc else 0, track))
+    return names, expected
+
+
+def check_corpus(names: list[str], expected: list[tuple[int, int] | None]) -> None:
+    """
+    Check that link_music.py parses the corpus as expected, both one name at
+    a time and in a single batch, so that a benchmark can't appear to get
+    faster by getting things wrong.
+    """
+    parsed, unmatched = link_music.parse_track_names(names)
+    assert len(unmatched) == expected.count(None), "unmatched count"
+    expected_parsed = [e for e in expected if e is not None]
+    assert len(parsed) == len(expected_parsed), "parsed count"
+    for p, e in zip(parsed, expected_parsed):
+        assert (p.info.disc_number, p.info.track_number) == e, f"{p.file_name}: {e}"
+        assert p.basename == link_music.track_basename_for_plex(p.info), p.file_name
+
+    for name, e in zip(names[:10_000], expected):
+        ti = link_music.extract_track_info(name)
+        assert (ti and (ti.disc_number, ti.track_number)) == (e or None), name
+
+
+def bench_parse(names: list[str], repeats: int) -> dict[str, float]:
+    """
+    Time parsing the corpus one name at a time (with extract_track_info()
+    and track_basename_for_plex()), an album at a time, and in a single batch
+    (with parse_track_names()). Return the throughput of each, in names per
+    second.
+    """
+    lm = link_music
+    albums = [
+        names[i : i + TRACKS_PER_ALBUM] for i in range(0, len(names), TRACKS_PER_ALBUM)
+    ]
+
+    def one_at_a_time():
+        for name in names:
+            ti = lm.extract_track_info(name)
+            if ti is not None:
+                lm.track_basename_for_plex(ti)
+
+    def album_at_a_time():
+        for album in albums:
+            lm.parse_track_names(album)
+
+    def single_batch():
+        lm.parse_track_names(names)
+
+    return {
+        f"parse_{name}_names_per_sec": len(names) / best_time(func, repeats)
+        for name, func in (
+            ("single", one_at_a_time),
+            ("album", album_at_a_time),
+            ("batch", single_batch),
+        )
+    }
+
+
+def main() -> int:
+    """Simple main()"""
+
+    args = parse_args(sys.argv[1:])
+
+    names, expected = make_corpus(args.corpus_size)
+    check_corpus(names, expected)
+    results = bench_parse(names, args.repeats)
+    return report(program, results, args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%Y-%m-%dT%H:%M:%S%z",
+    )
+
+    program = sys.argv[0].rsplit("/", maxsplit=1)[-1]
+    logging.debug("program=%s", program)
+
+    sys.exit(main())
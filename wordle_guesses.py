@@ -1,12 +1,20 @@
 #! /usr/bin/env python3
 """Given a template and a set of letters to ignore, print out a list of potential Wordle guesses."""
 
-import argparse
-import logging
-import re
+# NB: This script is run often enough, for queries that take so little time, that
+#     interpreter startup dominates. Modules that are slow to import (argparse,
+#     logging, socketserver, concurrent.futures, ...) are therefore imported where
+#     they are needed, and 'dataclasses', 're' and 'typing' aren't used at all.
+#     Check the effect of any change here with wordle_guesses_bench.py.
+import functools
+import itertools
+import math
+import os
 import sys
-from dataclasses import dataclass
+from collections import Counter, namedtuple
+from collections.abc import Iterable, Iterator
 from enum import Enum
+from io import TextIOBase
 
 
 # Code snarfed from https://stackoverflow.com/questions/7001144/range-over-character-in-python
@@ -29,6 +37,20 @@ CASE_OPT = "-c"
 CASE_OPT_LONG = "--case"
 NUM_OPT = "-n"
 NUM_OPT_LONG = "--num_guesses"
+WORD_LIST_OPT = "-w"
+WORD_LIST_OPT_LONG = "--word_list"
+PRESENT_OPT = "-p"
+PRESENT_OPT_LONG = "--present"
+FEEDBACK_OPT = "-f"
+FEEDBACK_OPT_LONG = "--feedback"
+RANK_OPT = "-r"
+RANK_OPT_LONG = "--rank"
+JOBS_OPT = "-j"
+JOBS_OPT_LONG = "--jobs"
+BATCH_OPT = "-b"
+BATCH_OPT_LONG = "--batch"
+SOCKET_OPT = "-s"
+SOCKET_OPT_LONG = "--socket"
 VERSION_OPT = "-v"
 VERSION_OPT_LONG = "--version"
 
@@ -37,6 +59,26 @@ CASE_OPT_UPPER = "upper"
 CASE_OPT_LOWER = "lower"
 
 DEFAULT_NUM_GUESSES_PER_LINE = 5
+OUTPUT_BLOCK_LINES = 1024
+
+# guesses x candidates below which ranking isn't worth starting worker processes for
+RANK_PARALLEL_MIN_WORK = 1_000_000
+
+WORD_LENGTH = 5
+ALPHABET = tuple(char_range("A", "Z"))
+
+TEMPLATE_CHARS = frozenset(ALPHABET + (BLANK_CHAR, CHANGE_CHAR))
+
+# letters as bits within a bitset; bit 0 is 'A'
+LETTER_BITS = {letter: 1 << i for i, letter in enumerate(ALPHABET)}
+ALL_LETTER_BITS = (1 << len(ALPHABET)) - 1
+BITS_LETTER = {bits: letter for letter, bits in LETTER_BITS.items()}
+
+FEEDBACK_SEPARATOR = ":"
+FEEDBACK_GREEN = "G"  # letter is in the answer at this position
+FEEDBACK_YELLOW = "Y"  # letter is in the answer, but not at this position
+FEEDBACK_GREY = "-"  # letter is not in the answer (beyond any green/yellow instances)
+FEEDBACK_CHARS = frozenset((FEEDBACK_GREEN, FEEDBACK_YELLOW, FEEDBACK_GREY))
 
 
 class OutputCase(Enum):
@@ -60,30 +102,39 @@ _TRANSFORMERS = {
 }
 
 
-@dataclass(frozen=True)
-class CommandArgs:
-    """Class to represent the results of parsing the command line arguments."""
+# A namedtuple rather than a dataclass; see the note on imports above.
+CommandArgsNT = namedtuple(
+    "CommandArgs",
+    "template, excluded_letters, included_letters, output_case, num_guesses_per_line,"
+    + " word_list, feedback, num_ranked, jobs, present_letters, batch, socket_path",
+    defaults=(None, (), None, 1, None, False, None),
+)
 
-    template: str
-    excluded_letters: set[str]
-    included_letters: set[str]
-    output_case: OutputCase
-    num_guesses_per_line: int
 
+class CommandArgs(CommandArgsNT):
+    """
+    Class to represent the results of parsing the command line arguments.
+    'template' is None when serving queries (--batch or --socket).
+    """
 
-def parse_args(argv: list[str]) -> CommandArgs | None:
+
+@functools.cache
+def build_parser():
     """
-    Given command-line arguments, return an 'CommandArgs' object.
-    'None' is returned if argument processing was not successful.
+    Return the command-line (argparse) parser. It is built once and reused, so
+    that answering many queries in one process (--batch or --socket) doesn't
+    pay for constructing it every time.
     """
+    import argparse
+
     parser = argparse.ArgumentParser(
         description=f"""\
             When playing Wordle, it is useful to write out lists of candidate words. This can be
             quite laborious, and can create a significant hindrance to those with diminished
             dexterity. %(prog)s is intended to alleviate this burden by listing out those candidate
             guesses for you. You specify the pattern for the candidate guesses using a template
-            where a '{CHANGE_CHAR}' indicates the letter to be changed to generate the candidate
-            guesses. The program will iterate through the alphabet, substituting the '{CHANGE_CHAR}'
+            where a '{CHANGE_CHAR}' indicates a letter to be changed to generate the candidate
+            guesses. The program will iterate through the alphabet, substituting each '{CHANGE_CHAR}'
             with each letter to generate a guess. You can specify a list of letters to exclude when
             generating the candidate guesses; typically, you would do this for the letters which
             Wordle has indicated aren't in the answer. Alternatively, instead of iterating through
@@ -94,10 +145,12 @@ def parse_args(argv: list[str]) -> CommandArgs | None:
     )
     parser.add_argument(
         "template",
+        nargs="?",
         help=f"""\
             template is a 5-character sequence composed of letters,
-            any number of the character '{BLANK_CHAR}', and a single instance of the character
-            '{CHANGE_CHAR}' ('{CHANGE_CHAR}a{BLANK_CHAR}am', for example)""",
+            any number of the character '{BLANK_CHAR}', and one or more instances of the character
+            '{CHANGE_CHAR}' ('{CHANGE_CHAR}a{BLANK_CHAR}am' or '{CHANGE_CHAR}a{CHANGE_CHAR}am',
+            for example)""",
     )
 
     # it is an error to specify both -e and -i options
@@ -135,6 +188,73 @@ def parse_args(argv: list[str]) -> CommandArgs | None:
         help=f"""specify the number of guesses per line of output.
         The default is {DEFAULT_NUM_GUESSES_PER_LINE}.""",
     )
+    parser.add_argument(
+        WORD_LIST_OPT,
+        WORD_LIST_OPT_LONG,
+        required=False,
+        metavar="word_list_file",
+        help="""specify a file of words (one per line); only candidate guesses
+        that appear in the word list are output.""",
+    )
+
+    # instead of a template, read queries (a template plus options) one per line
+    server_group = parser.add_mutually_exclusive_group()
+    server_group.add_argument(
+        BATCH_OPT,
+        BATCH_OPT_LONG,
+        action="store_true",
+        help="""read queries from standard input, one per line, each consisting of a
+        template and any of the options above (which can't also be given on the
+        command line); the output for each query is followed by an empty line.""",
+    )
+    server_group.add_argument(
+        SOCKET_OPT,
+        SOCKET_OPT_LONG,
+        metavar="socket_path",
+        help=f"""like {BATCH_OPT_LONG}, but serve queries from clients connecting
+        to a Unix domain socket created at socket_path.""",
+    )
+
+    parser.add_argument(
+        PRESENT_OPT,
+        PRESENT_OPT_LONG,
+        required=False,
+        metavar="present_letters",
+        help=f"""specify letters known to be in the answer, repeating a letter that
+        appears more than once; only words from the word list (see
+        {WORD_LIST_OPT_LONG}) that contain all of them are output.""",
+    )
+    parser.add_argument(
+        FEEDBACK_OPT,
+        FEEDBACK_OPT_LONG,
+        required=False,
+        action="append",
+        metavar="guess:result",
+        help=f"""specify a previous guess along with the result Wordle reported for
+        it, one character per letter: '{FEEDBACK_GREEN}' (green), '{FEEDBACK_YELLOW}'
+        (yellow), or '{FEEDBACK_GREY}' (grey); 'crane{FEEDBACK_SEPARATOR}gy---', for
+        example. May be repeated. Only candidate guesses consistent with every result
+        are output.""",
+    )
+    parser.add_argument(
+        RANK_OPT,
+        RANK_OPT_LONG,
+        type=int,
+        required=False,
+        metavar="num_ranked",
+        help=f"""instead of listing the candidate guesses, list the num_ranked words
+        from the word list (see {WORD_LIST_OPT_LONG}) that are expected to give the
+        most information about which candidate is the answer, along with that
+        expected information in bits.""",
+    )
+    parser.add_argument(
+        JOBS_OPT,
+        JOBS_OPT_LONG,
+        type=int,
+        required=False,
+        help=f"""specify the number of processes used for {RANK_OPT_LONG}.
+        The default is the number of CPUs.""",
+    )
     parser.add_argument(
         VERSION_OPT,
         VERSION_OPT_LONG,
@@ -142,15 +262,25 @@ def parse_args(argv: list[str]) -> CommandArgs | None:
         version=f"%(prog)s {__version__}",
     )
 
-    if len(sys.argv) == 1:
-        parser.print_help()
-        return None
+    return parser
 
-    args = parser.parse_args(argv)
-    logging.debug("args=%s", args)
 
-    # extract and validate required template argument
-    templ_arg = args.template
+def is_valid_template(template: str) -> bool:
+    """Return True if (uppercase) 'template' is in the right format."""
+    return (
+        len(template) == WORD_LENGTH
+        and CHANGE_CHAR in template
+        and TEMPLATE_CHARS.issuperset(template)
+    )
+
+
+def parse_template(templ_arg: str) -> str | None:
+    """
+    Given a template argument, return the corresponding (uppercase) template.
+    'None' is returned if the template is not valid.
+    """
+    import logging
+
     logging.debug("template=%s", templ_arg)
     template = templ_arg.upper()
 
@@ -161,9 +291,7 @@ def parse_args(argv: list[str]) -> CommandArgs | None:
         )
         return None
 
-    template_re = re.compile(f"[A-Z{BLANK_CHAR}]*\\{CHANGE_CHAR}[A-Z{BLANK_CHAR}]*")
-    template_match = template_re.fullmatch(template)
-    if template_match is None:
+    if not is_valid_template(template):
         print(
             f"{program}: "
             + f"template '{templ_arg}' is in wrong format (e.g. missing '{CHANGE_CHAR}' character)",
@@ -171,6 +299,64 @@ def parse_args(argv: list[str]) -> CommandArgs | None:
         )
         return None
 
+    return template
+
+
+def parse_args(argv: list[str]) -> CommandArgs | None:
+    """
+    Given command-line arguments, return an 'CommandArgs' object.
+    'None' is returned if argument processing was not successful.
+    """
+    import logging
+
+    parser = build_parser()
+
+    if len(argv) == 0:
+        parser.print_help()
+        return None
+
+    args = parser.parse_args(argv)
+    logging.debug("args=%s", args)
+
+    # extract and validate the template argument, which is
+    # required unless queries are to be read from elsewhere
+    template: str | None = None
+    if args.batch or args.socket is not None:
+        if args.template is not None:
+            print(
+                f"{program}: template not allowed with "
+                + f"{BATCH_OPT_LONG} or {SOCKET_OPT_LONG}",
+                file=sys.stderr,
+            )
+            return None
+        # the options for each query are given with the query itself
+        query_opts = {
+            EXCLUDE_OPT_LONG: args.exclude,
+            INCLUDE_OPT_LONG: args.include,
+            CASE_OPT_LONG: args.case,
+            NUM_OPT_LONG: args.num_guesses,
+            WORD_LIST_OPT_LONG: args.word_list,
+            PRESENT_OPT_LONG: args.present,
+            FEEDBACK_OPT_LONG: args.feedback,
+            RANK_OPT_LONG: args.rank,
+            JOBS_OPT_LONG: args.jobs,
+        }
+        given_opts = [opt for opt, value in query_opts.items() if value is not None]
+        if given_opts:
+            print(
+                f"{program}: {', '.join(given_opts)} not allowed with "
+                + f"{BATCH_OPT_LONG} or {SOCKET_OPT_LONG} (give them with each query)",
+                file=sys.stderr,
+            )
+            return None
+    elif args.template is None:
+        print(f"{program}: template argument is required", file=sys.stderr)
+        return None
+    else:
+        template = parse_template(args.template)
+        if template is None:
+            return None
+
     # built set of letters to exclude from iteration
     excluded_letters: set[str] = set()
     if args.exclude is not None:
@@ -209,22 +395,169 @@ def parse_args(argv: list[str]) -> CommandArgs | None:
     num_guesses = DEFAULT_NUM_GUESSES_PER_LINE
     if args.num_guesses is not None:
         num_guesses = args.num_guesses
+        if num_guesses < 1:
+            print(
+                f"{program}: number of guesses per line must be at least 1",
+                file=sys.stderr,
+            )
+            return None
     logging.debug("num_guesses=%s", num_guesses)
 
+    logging.debug("word_list=%s", args.word_list)
+
+    # ranking guesses requires a word list to draw them from
+    if args.rank is not None:
+        if args.word_list is None:
+            print(
+                f"{program}: {RANK_OPT_LONG} requires {WORD_LIST_OPT_LONG}",
+                file=sys.stderr,
+            )
+            return None
+        if args.rank < 1:
+            print(
+                f"{program}: number of ranked guesses must be at least 1",
+                file=sys.stderr,
+            )
+            return None
+    logging.debug("num_ranked=%s", args.rank)
+
+    # determine the number of processes used for ranking
+    jobs = os.cpu_count() or 1
+    if args.jobs is not None:
+        jobs = args.jobs
+        if jobs < 1:
+            print(f"{program}: number of jobs must be at least 1", file=sys.stderr)
+            return None
+    logging.debug("jobs=%s", jobs)
+
+    # build list of previous guesses and their results
+    feedback: list[tuple[str, str]] = []
+    for feedback_arg in args.feedback or []:
+        guess, _, result = feedback_arg.upper().partition(FEEDBACK_SEPARATOR)
+        if (
+            len(guess) != WORD_LENGTH
+            or len(result) != WORD_LENGTH
+            or not set(ALPHABET).issuperset(guess)
+            or not FEEDBACK_CHARS.issuperset(result)
+        ):
+            print(
+                f"{program}: feedback '{feedback_arg}' is in wrong format "
+                + f"(e.g. 'crane{FEEDBACK_SEPARATOR}gy---')",
+                file=sys.stderr,
+            )
+            return None
+        feedback.append((guess, result))
+    logging.debug("feedback=%s", feedback)
+
+    # count the letters known to be present, as minimum counts
+    present_letters = None
+    if args.present is not None:
+        present_arg = args.present.upper()
+        if args.word_list is None:
+            print(
+                f"{program}: {PRESENT_OPT_LONG} requires {WORD_LIST_OPT_LONG}",
+                file=sys.stderr,
+            )
+            return None
+        if len(present_arg) > WORD_LENGTH or not set(ALPHABET).issuperset(present_arg):
+            print(
+                f"{program}: present letters argument {args.present} must be "
+                + f"at most {WORD_LENGTH} letters",
+                file=sys.stderr,
+            )
+            return None
+        present_letters = Counter(present_arg)
+    logging.debug("present_letters=%s", present_letters)
+
     return CommandArgs(
         template=template,
         excluded_letters=excluded_letters,
         included_letters=included_letters,
         output_case=output_case,
         num_guesses_per_line=num_guesses,
+        word_list=args.word_list,
+        feedback=tuple(feedback),
+        num_ranked=args.rank,
+        jobs=jobs,
+        present_letters=present_letters,
+        batch=args.batch,
+        socket_path=args.socket,
+    )
+
+
+# the options handled by parse_simple_args(), and the corresponding argparse 'dest'
+SIMPLE_OPTS = {
+    EXCLUDE_OPT: "exclude",
+    EXCLUDE_OPT_LONG: "exclude",
+    INCLUDE_OPT: "include",
+    INCLUDE_OPT_LONG: "include",
+    CASE_OPT: "case",
+    CASE_OPT_LONG: "case",
+    NUM_OPT: "num_guesses",
+    NUM_OPT_LONG: "num_guesses",
+}
+
+
+def parse_simple_args(argv: list[str]) -> CommandArgs | None:
+    """
+    Fast path for parse_args(): given command-line arguments consisting of just
+    a template and any of the -e, -i, -c and -n options, return a 'CommandArgs'
+    object without importing argparse or building a parser. 'None' is returned
+    for anything else, including anything invalid, leaving parse_args() to deal
+    with (and report on) it.
+    """
+    values: dict[str, str] = {}
+    template: str | None = None
+    arg_iter = iter(argv)
+    for arg in arg_iter:
+        if arg in SIMPLE_OPTS:
+            dest = SIMPLE_OPTS[arg]
+            value = next(arg_iter, None)
+            if value is None or dest in values:
+                return None
+            values[dest] = value
+        elif template is not None or arg.startswith("-"):
+            return None
+        else:
+            template = arg.upper()
+
+    if template is None or not is_valid_template(template):
+        return None
+    if "exclude" in values and "include" in values:
+        return None
+
+    letters = set(ALPHABET)
+    excluded_arg = values.get("exclude")
+    included_arg = values.get("include")
+    case_arg = values.get("case", CASE_OPT_TITLE)
+    num_arg = values.get("num_guesses", str(DEFAULT_NUM_GUESSES_PER_LINE))
+    for letters_arg in (excluded_arg, included_arg):
+        if letters_arg is not None:
+            if not letters_arg or not letters.issuperset(letters_arg.upper()):
+                return None
+    if case_arg not in (CASE_OPT_TITLE, CASE_OPT_UPPER, CASE_OPT_LOWER):
+        return None
+    if not (num_arg.isascii() and num_arg.isdigit() and int(num_arg) >= 1):
+        return None
+
+    return CommandArgs(
+        template=template,
+        excluded_letters=set(excluded_arg.upper()) if excluded_arg else set(),
+        included_letters=set(included_arg.upper()) if included_arg else set(),
+        output_case=OutputCase(case_arg),
+        num_guesses_per_line=int(num_arg),
+        jobs=os.cpu_count() or 1,
     )
 
 
 def list_guesses(
     template: str, excluded_letters: set[str], included_letters: set[str]
-) -> list[str]:
+) -> Iterator[str]:
     """Given 'template' and sets of ignored letters to exclude ('excluded_letters')
-    or include ('included_letters'), return a list of potential Wordle guesses.
+    or include ('included_letters'), return an iterator over potential Wordle guesses.
+    Each CHANGE_CHAR in 'template' is substituted independently, so the guesses are
+    the cartesian product of the permitted letters over those positions; they are
+    generated lazily, in alphabetical order, rather than built up as a list.
     All arguments are assumed to be all uppercase. If both 'excluded_letters' and
     'included_letters' are non-empty, the latter is used."""
     if template is None:
@@ -234,13 +567,11 @@ def list_guesses(
     if len(template) != 5:
         raise ValueError(f"template '{template}' must be 5 letters in length")
 
-    parts = template.split(CHANGE_CHAR)
-    if len(parts) == 1:
+    if CHANGE_CHAR not in template:
         raise ValueError(f"template '{template}' missing '{CHANGE_CHAR}'")
 
-    front_part = parts[0]
-    back_part = parts[1]
-    if not front_part.isalpha or not back_part.isalpha:
+    fixed_chars = template.replace(CHANGE_CHAR, "").replace(BLANK_CHAR, "")
+    if fixed_chars and not fixed_chars.isalpha():
         raise ValueError(
             f"template '{template}' has non-letter characters other than '{CHANGE_CHAR}'"
         )
@@ -252,80 +583,702 @@ def list_guesses(
     if len(bad_letters) > 0:
         raise ValueError("included_letters contains one or more non-letter characters")
 
-    guesses: list[str]
+    change_letters: tuple[str, ...]
     if len(included_letters) == 0:
-        guesses = [
-            letter.join([front_part, back_part])
-            for letter in char_range("A", "Z")
-            if letter not in excluded_letters
-        ]
+        change_letters = tuple(x for x in ALPHABET if x not in excluded_letters)
     else:
-        guesses = [
-            letter.join([front_part, back_part])
-            for letter in char_range("A", "Z")
-            if letter in included_letters
+        change_letters = tuple(x for x in ALPHABET if x in included_letters)
+
+    # the letters permitted at each position: a fixed character contributes only
+    # itself, so itertools.product() never visits a pruned combination
+    position_choices = [
+        change_letters if char == CHANGE_CHAR else (char,) for char in template
+    ]
+    return map("".join, itertools.product(*position_choices))
+
+
+def letters_to_bits(letters: Iterable[str]) -> int:
+    """Return the bitset corresponding to 'letters'."""
+    bits = 0
+    for letter in letters:
+        bits |= LETTER_BITS[letter]
+    return bits
+
+
+def bits_to_letters(bits: int) -> tuple[str, ...]:
+    """Return the letters in bitset 'bits', in alphabetical order."""
+    return tuple(letter for letter in ALPHABET if bits & LETTER_BITS[letter])
+
+
+ConstraintsNT = namedtuple(
+    "Constraints", "allowed, min_counts, max_counts, blanks", defaults=(frozenset(),)
+)
+
+
+class Constraints(ConstraintsNT):
+    """
+    The constraints a candidate guess must satisfy: a bitset of the letters allowed
+    at each position ('allowed'), plus the minimum and maximum number of times a
+    letter may appear ('min_counts' and 'max_counts', dicts keyed by letter).
+    Positions holding a BLANK_CHAR in the template are listed in 'blanks'.
+    """
+
+    @classmethod
+    def compile(
+        cls,
+        template: str,
+        excluded_letters: set[str],
+        included_letters: set[str],
+        feedback: Iterable[tuple[str, str]] = (),
+        present_letters: Counter[str] | None = None,
+    ) -> "Constraints":
+        """
+        Given the same arguments as list_guesses() plus a sequence of previous
+        (guess, result) pairs, and the number of times letters are known to be
+        present ('present_letters'), return the corresponding Constraints.
+        """
+        if len(included_letters) == 0:
+            change_bits = ALL_LETTER_BITS & ~letters_to_bits(excluded_letters)
+        else:
+            change_bits = letters_to_bits(included_letters)
+
+        allowed: list[int] = []
+        for char in template:
+            if char == CHANGE_CHAR:
+                allowed.append(change_bits)
+            elif char == BLANK_CHAR:
+                allowed.append(ALL_LETTER_BITS)
+            else:
+                allowed.append(LETTER_BITS[char])
+        blanks = frozenset(i for i, char in enumerate(template) if char == BLANK_CHAR)
+
+        min_counts: dict[str, int] = {}
+        max_counts: dict[str, int] = {}
+        for guess, result in feedback:
+            # a letter is in the answer at least as many times as it was
+            # marked green or yellow; a grey mark makes that count exact
+            marked = Counter(
+                letter for letter, mark in zip(guess, result) if mark != FEEDBACK_GREY
+            )
+            for position, (letter, mark) in enumerate(zip(guess, result)):
+                if mark == FEEDBACK_GREEN:
+                    allowed[position] &= LETTER_BITS[letter]
+                else:
+                    allowed[position] &= ~LETTER_BITS[letter]
+                if mark == FEEDBACK_GREY:
+                    max_counts[letter] = min(
+                        max_counts.get(letter, WORD_LENGTH), marked[letter]
+                    )
+            for letter, count in marked.items():
+                min_counts[letter] = max(min_counts.get(letter, 0), count)
+        for letter, count in (present_letters or {}).items():
+            min_counts[letter] = max(min_counts.get(letter, 0), count)
+
+        cls._propagate(allowed, min_counts, max_counts)
+
+        return cls(tuple(allowed), min_counts, max_counts, blanks)
+
+    @staticmethod
+    def _propagate(
+        allowed: list[int], min_counts: dict[str, int], max_counts: dict[str, int]
+    ) -> None:
+        """
+        Narrow 'allowed' in place until no letter count forces any further change:
+        a letter that has used up its maximum count on positions where it is the
+        only choice is removed everywhere else, and a letter that has exactly as
+        many possible positions as its minimum count is fixed at those positions.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for letter, max_count in max_counts.items():
+                bit = LETTER_BITS[letter]
+                if sum(1 for bits in allowed if bits == bit) < max_count:
+                    continue
+                for position, bits in enumerate(allowed):
+                    if bits != bit and bits & bit:
+                        allowed[position] = bits & ~bit
+                        changed = True
+            for letter, min_count in min_counts.items():
+                bit = LETTER_BITS[letter]
+                possible = [i for i, bits in enumerate(allowed) if bits & bit]
+                if len(possible) != min_count:
+                    continue
+                for position in possible:
+                    if allowed[position] != bit:
+                        allowed[position] = bit
+                        changed = True
+
+    def is_satisfiable(self) -> bool:
+        """Return False if no word can possibly satisfy these constraints."""
+        if not all(self.allowed):
+            return False
+        if sum(self.min_counts.values()) > WORD_LENGTH:
+            return False
+        return all(
+            sum(1 for bits in self.allowed if bits & LETTER_BITS[letter]) >= min_count
+            for letter, min_count in self.min_counts.items()
+        )
+
+    def generate(self) -> Iterator[str]:
+        """
+        Generate, in alphabetical order, the potential guesses satisfying these
+        constraints. A BLANK_CHAR position is rendered as-is and may stand in for any
+        letter still required by 'min_counts' (or, if only one letter is allowed
+        there, such as a green one, for that letter). Partial guesses that exceed a
+        maximum count, or can no longer reach every minimum count, are abandoned
+        before any string is built for them.
+        """
+        if not self.is_satisfiable():
+            return
+
+        # each choice is the character rendered and the letter it places, if any
+        choices = []
+        for i, bits in enumerate(self.allowed):
+            if i not in self.blanks:
+                choices.append([(letter, letter) for letter in bits_to_letters(bits)])
+            elif bits in BITS_LETTER:
+                choices.append([(BLANK_CHAR, BITS_LETTER[bits])])
+            else:
+                choices.append([(BLANK_CHAR, None)])
+        # open_slots[i] is the number of positions from 'i' onward
+        # that could still supply a required letter
+        open_slots = [WORD_LENGTH - i for i in range(WORD_LENGTH + 1)]
+        min_counts = self.min_counts
+        max_counts = self.max_counts
+        counts: Counter[str] = Counter()
+        prefix: list[str] = []
+
+        def deficit() -> int:
+            return sum(
+                max(0, min_count - counts[letter])
+                for letter, min_count in min_counts.items()
+            )
+
+        def extend(position: int, wildcards: int) -> Iterator[str]:
+            # 'wildcards' is the number of blanks so far that may stand in for
+            # any required letter, so the deficit they can make up
+            if position == WORD_LENGTH:
+                yield "".join(prefix)
+                return
+            for char, letter in choices[position]:
+                if letter is not None:
+                    if counts[letter] >= max_counts.get(letter, WORD_LENGTH):
+                        continue
+                    counts[letter] += 1
+                prefix.append(char)
+                next_wildcards = wildcards + (letter is None)
+                if deficit() <= open_slots[position + 1] + next_wildcards:
+                    yield from extend(position + 1, next_wildcards)
+                prefix.pop()
+                if letter is not None:
+                    counts[letter] -= 1
+
+        yield from extend(0, 0)
+
+
+class WordIndex:
+    """
+    Positional index over a list of 5-letter words. For each (position, letter) pair the
+    index holds a bitmask whose bit 'i' is set when 'words[i]' has that letter at that
+    position, so matching a template against the whole word list is a handful of
+    big-integer ANDs and ORs rather than a Python loop over strings. Likewise, for
+    each letter and count 'k' the index holds the mask of words containing that
+    letter at least 'k' times.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        import logging
+
+        self.words: list[str] = sorted(
+            {
+                word
+                for word in (w.strip().upper() for w in words)
+                if len(word) == WORD_LENGTH and word.isascii() and word.isalpha()
+            }
+        )
+        self.all_mask: int = (1 << len(self.words)) - 1
+
+        # build each bitmask in a bytearray and convert once; OR-ing single bits into
+        # a growing int is quadratic in the size of the word list
+        num_bytes = (len(self.words) + 7) // 8
+        bitmaps = [
+            {letter: bytearray(num_bytes) for letter in ALPHABET}
+            for _ in range(WORD_LENGTH)
+        ]
+        count_bitmaps = {
+            letter: [bytearray(num_bytes) for _ in range(WORD_LENGTH)]
+            for letter in ALPHABET
+        }
+        for i, word in enumerate(self.words):
+            byte_index, bit = divmod(i, 8)
+            for position, letter in enumerate(word):
+                bitmaps[position][letter][byte_index] |= 1 << bit
+            for letter, count in Counter(word).items():
+                for k in range(count):
+                    count_bitmaps[letter][k][byte_index] |= 1 << bit
+        self.position_masks: list[dict[str, int]] = [
+            {
+                letter: int.from_bytes(bitmap, "little")
+                for letter, bitmap in position_bitmaps.items()
+            }
+            for position_bitmaps in bitmaps
         ]
+        # count_masks[letter][k - 1] is the mask of words with 'letter' at least k times
+        self.count_masks: dict[str, list[int]] = {
+            letter: [int.from_bytes(bitmap, "little") for bitmap in letter_bitmaps]
+            for letter, letter_bitmaps in count_bitmaps.items()
+        }
+        logging.debug("indexed %d words", len(self.words))
 
-    return guesses
+    @classmethod
+    def from_file(cls, path: str) -> "WordIndex":
+        """Build a WordIndex from a file containing one word per line."""
+        with open(path, encoding="utf-8", errors="replace") as word_file:
+            return cls(word_file)
 
+    def letters_mask(self, position: int, letters: Iterable[str]) -> int:
+        """Return the mask of words having any of 'letters' at 'position'."""
+        mask = 0
+        for letter in letters:
+            mask |= self.position_masks[position][letter]
+        return mask
 
-# type representing lines of guesses to output
-OutputGuessLines = list[list[str]]
+    def words_in(self, mask: int) -> list[str]:
+        """Return the words whose bits are set in 'mask', in sorted order."""
+        # walking the binary string once is linear; peeling off the lowest bit
+        # with big-integer arithmetic would cost a full-width operation per match
+        bits = bin(mask)[:1:-1]
+        words = self.words
+        matches = []
+        i = bits.find("1")
+        while i >= 0:
+            matches.append(words[i])
+            i = bits.find("1", i + 1)
+        return matches
 
+    def match(
+        self, template: str, excluded_letters: set[str], included_letters: set[str]
+    ) -> list[str]:
+        """Given the same arguments as list_guesses(), return the words in the index that
+        match 'template'. A letter in the template must match exactly, a CHANGE_CHAR
+        matches any letter permitted by 'excluded_letters'/'included_letters', and a
+        BLANK_CHAR matches any letter."""
+        return self.match_constraints(
+            Constraints.compile(template, excluded_letters, included_letters)
+        )
+
+    def match_constraints(self, constraints: Constraints) -> list[str]:
+        """Return the words in the index that satisfy 'constraints'. Unlike
+        Constraints.generate(), a BLANK_CHAR position here stands for a real
+        letter, which must satisfy the constraints like any other."""
+        return self.words_in(self.constraints_mask(constraints))
+
+    def constraints_mask(self, constraints: Constraints) -> int:
+        """Return the mask of words in the index that satisfy 'constraints'."""
+        if not constraints.is_satisfiable():
+            return 0
+
+        mask = self.all_mask
+        for position, bits in enumerate(constraints.allowed):
+            if bits != ALL_LETTER_BITS:
+                mask &= self.letters_mask(position, bits_to_letters(bits))
+        for letter, min_count in constraints.min_counts.items():
+            mask &= self.count_masks[letter][min_count - 1]
+        for letter, max_count in constraints.max_counts.items():
+            if max_count < WORD_LENGTH:
+                mask &= ~self.count_masks[letter][max_count]
+
+        return mask
+
+    def _split_on_letter(
+        self, mask: int, letter: str, positions: tuple[int, ...]
+    ) -> Iterator[int]:
+        """
+        Split the words in 'mask' by the Wordle result they would give for the
+        instances of 'letter' at 'positions' of a guess. Those results depend only
+        on which of the positions hold 'letter' in the answer (greens) and on how
+        many times the answer contains 'letter': the remaining instances are marked
+        yellow, left to right, until the answer's count of 'letter' is used up.
+        """
+        position_masks = self.position_masks
+        count_masks = self.count_masks[letter]
+        guess_count = len(positions)
+        for greens in itertools.product((True, False), repeat=guess_count):
+            green_mask = mask
+            for position, green in zip(positions, greens):
+                if green:
+                    green_mask &= position_masks[position][letter]
+                else:
+                    green_mask &= ~position_masks[position][letter]
+            if not green_mask:
+                continue
+            # 'matched' is min(guess count, answer count) of the letter
+            for matched in range(sum(greens), guess_count + 1):
+                part = green_mask
+                if matched > 0:
+                    part &= count_masks[matched - 1]
+                if matched < guess_count:
+                    part &= ~count_masks[matched]
+                if part:
+                    yield part
+
+    def partition(self, guess: str, mask: int) -> list[int]:
+        """
+        Return the masks of the non-empty subsets into which the words in 'mask'
+        are partitioned by the Wordle result they would give for 'guess'.
+        """
+        letter_positions: dict[str, list[int]] = {}
+        for position, letter in enumerate(guess):
+            letter_positions.setdefault(letter, []).append(position)
+
+        parts = [mask] if mask else []
+        for letter, positions in letter_positions.items():
+            if len(positions) == 1:
+                # the common case, split inline: green, yellow, or grey
+                green_mask = self.position_masks[positions[0]][letter]
+                present_mask = self.count_masks[letter][0]
+                split_parts = []
+                for part in parts:
+                    green_part = part & green_mask
+                    other_part = part ^ green_part
+                    yellow_part = other_part & present_mask
+                    grey_part = other_part ^ yellow_part
+                    if green_part:
+                        split_parts.append(green_part)
+                    if yellow_part:
+                        split_parts.append(yellow_part)
+                    if grey_part:
+                        split_parts.append(grey_part)
+                parts = split_parts
+            else:
+                parts = [
+                    split_part
+                    for part in parts
+                    for split_part in self._split_on_letter(
+                        part, letter, tuple(positions)
+                    )
+                ]
+        return parts
 
-def marshall_guesses(guesses: list[str], num_words_per_line: int) -> OutputGuessLines:
+    def expected_information(self, guess: str, mask: int) -> float:
+        """
+        Return the expected information, in bits, that the Wordle result for 'guess'
+        gives about an answer chosen uniformly from the words in 'mask'; i.e.
+        the entropy of the partition of those words by result.
+        """
+        total = mask.bit_count()
+        if total == 0:
+            return 0.0
+        sizes = [part.bit_count() for part in self.partition(guess, mask)]
+        return math.log2(total) - sum(size * math.log2(size) for size in sizes) / total
+
+
+def score_guesses(
+    word_index: WordIndex, guesses: Iterable[str]
+) -> list[tuple[str, float]]:
     """
-    Given a list of potential Wordle guesses and an output case,
-    return an OutputGuessLines representing lines of guesses to output.
+    Return each of 'guesses' paired with the expected information it
+    gives about which of the words in 'word_index' is the answer.
     """
-    lines: OutputGuessLines = []
+    return [
+        (guess, word_index.expected_information(guess, word_index.all_mask))
+        for guess in guesses
+    ]
 
-    current_line: list[str] = []
-    for guess in guesses:
-        if len(current_line) == num_words_per_line:
-            lines.append(current_line)
-            current_line = []
-        current_line.append(guess)
 
-    if len(current_line) > 0:
-        lines.append(current_line)
+_worker_index: WordIndex | None = None
 
-    return lines
 
+def _init_rank_worker(candidates: list[str]) -> None:
+    """Initialise a ranking worker process with an index of the candidates."""
+    global _worker_index
+    _worker_index = WordIndex(candidates)
 
-def print_guesses(guesses: OutputGuessLines) -> None:
-    """Given a list of potential Wordle guesses and an output case, print them out."""
-    for guess_list in guesses:
-        print("\t".join(guess_list))
 
+def _score_guesses_in_worker(guesses: list[str]) -> list[tuple[str, float]]:
+    """score_guesses() against the index built by _init_rank_worker()."""
+    return score_guesses(_worker_index, guesses)
 
-def main() -> int:
-    """Simple main()"""
 
-    args = parse_args(sys.argv[1:])
-    if args is None:
-        return 1
+def rank_guesses(
+    guesses: list[str], candidates: list[str], jobs: int
+) -> list[tuple[str, float]]:
+    """
+    Given potential guesses and the candidates for the answer, return the guesses
+    paired with the expected information (in bits) each gives about the answer,
+    best first; ties are broken in favour of guesses that could be the answer.
+    The work is spread over 'jobs' processes when there is enough of it.
+    """
+    # the bitmasks of an index over just the candidates are far narrower
+    # than masks selecting the candidates from the full word list
+    if jobs > 1 and len(guesses) * len(candidates) >= RANK_PARALLEL_MIN_WORK:
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunk_size = -(-len(guesses) // (jobs * 4))
+        chunks = [
+            guesses[i : i + chunk_size] for i in range(0, len(guesses), chunk_size)
+        ]
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_rank_worker,
+            initargs=(candidates,),
+        ) as executor:
+            scores = [
+                score
+                for chunk_scores in executor.map(_score_guesses_in_worker, chunks)
+                for score in chunk_scores
+            ]
+    else:
+        scores = score_guesses(WordIndex(candidates), guesses)
+
+    candidate_set = set(candidates)
+    return sorted(
+        scores,
+        key=lambda score: (-score[1], score[0] not in candidate_set, score[0]),
+    )
+
+
+# type representing lines of guesses to output, each already joined into a string
+OutputGuessLines = Iterator[str]
+
+
+def marshall_guesses(
+    guesses: Iterable[str], num_words_per_line: int
+) -> OutputGuessLines:
+    """
+    Given potential Wordle guesses, lazily generate the tab-separated
+    lines of guesses to output, 'num_words_per_line' guesses per line.
+    """
+    guesses = iter(guesses)
+    while current_line := list(itertools.islice(guesses, num_words_per_line)):
+        yield "\t".join(current_line)
+
+
+def print_guesses(guesses: OutputGuessLines, out: TextIOBase | None = None) -> None:
+    """
+    Given lines of potential Wordle guesses, write them to 'out' (standard output
+    by default). Lines are gathered into blocks of OUTPUT_BLOCK_LINES so that there
+    is one write() per block rather than one print() per line.
+    """
+    if out is None:
+        out = sys.stdout
+    while block := list(itertools.islice(guesses, OUTPUT_BLOCK_LINES)):
+        block.append("")
+        out.write("\n".join(block))
 
-    guesses = list_guesses(args.template, args.excluded_letters, args.included_letters)
 
-    guesses = list(map(args.output_case.transform, guesses))
+@functools.cache
+def _load_word_index(path: str, mtime_ns: int, size: int) -> WordIndex:
+    """Cached WordIndex.from_file(); 'mtime_ns' and 'size' only serve to key the cache."""
+    import logging
+
+    logging.debug("loading word list %s (mtime_ns=%d size=%d)", path, mtime_ns, size)
+    return WordIndex.from_file(path)
+
+
+def load_word_index(path: str) -> WordIndex:
+    """
+    Return a WordIndex for the word list at 'path'. The index is built once per
+    process and reused by subsequent queries unless the file has been modified.
+    """
+    st = os.stat(path)
+    return _load_word_index(os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def write_guesses(args: CommandArgs, out: TextIOBase | None = None) -> int:
+    """
+    Given the arguments for a single query, write the corresponding
+    potential Wordle guesses to 'out' (standard output by default).
+    Returns 0 on success, and 1 otherwise.
+    """
+    if args.word_list is not None or len(args.feedback) > 0:
+        constraints = Constraints.compile(
+            args.template,
+            args.excluded_letters,
+            args.included_letters,
+            args.feedback,
+            args.present_letters,
+        )
+
+    if args.word_list is not None:
+        try:
+            word_index = load_word_index(args.word_list)
+        except OSError as e:
+            print(f"{program}: could not read word list: {e}", file=sys.stderr)
+            return 1
+        guesses = word_index.words_in(word_index.constraints_mask(constraints))
+        if args.num_ranked is not None:
+            ranked = rank_guesses(word_index.words, guesses, args.jobs)
+            print_guesses(
+                (
+                    f"{args.output_case.transform(guess)}\t{information:.3f}"
+                    for guess, information in ranked[: args.num_ranked]
+                ),
+                out,
+            )
+            return 0
+    elif len(args.feedback) > 0:
+        guesses = constraints.generate()
+    else:
+        guesses = list_guesses(
+            args.template, args.excluded_letters, args.included_letters
+        )
+
+    guesses = map(args.output_case.transform, guesses)
 
     guess_lines = marshall_guesses(guesses, args.num_guesses_per_line)
-    print_guesses(guess_lines)
+    print_guesses(guess_lines, out)
 
     return 0
 
 
-program: str
+def answer_query(query: str, out: TextIOBase) -> int:
+    """
+    Given a query (a template plus options, as they would appear on the command
+    line), write the corresponding potential Wordle guesses to 'out', followed
+    by an empty line. Returns 0 on success, and 1 otherwise.
+    """
+    import shlex
+
+    status = 1
+    try:
+        query_argv = shlex.split(query)
+        query_args = parse_simple_args(query_argv) or parse_args(query_argv)
+        if query_args is None:
+            pass
+        elif query_args.template is None:
+            print(
+                f"{program}: query '{query.strip()}' has no template", file=sys.stderr
+            )
+        else:
+            status = write_guesses(query_args, out)
+    except SystemExit:
+        # argparse exits after reporting a bad query (or after --help/--version)
+        pass
+    except ValueError as e:
+        print(f"{program}: {e}", file=sys.stderr)
+
+    out.write("\n")
+    out.flush()
+    return status
+
+
+def is_query(line: str) -> bool:
+    """Return True if 'line' is a query rather than an empty or '#' comment line."""
+    line = line.strip()
+    return len(line) > 0 and not line.startswith("#")
+
+
+def serve_batch(queries: TextIOBase, out: TextIOBase) -> int:
+    """
+    Answer each of the queries read from 'queries', one per line, writing the
+    results to 'out'. Returns 0 if every query succeeded, and 1 otherwise.
+    """
+    status = 0
+    for line in queries:
+        if is_query(line):
+            status |= answer_query(line.strip(), out)
+    return status
+
+
+def is_stale_socket(socket_path: str) -> bool:
+    """
+    Return True if 'socket_path' is a Unix domain socket that nothing is
+    listening on (left behind by a server that was killed, say).
+    """
+    import socket
+    import stat
+
+    if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except ConnectionRefusedError:
+            return True
+    return False
+
+
+def serve_socket(socket_path: str) -> int:
+    """
+    Answer queries from clients connecting to a Unix domain socket at
+    'socket_path', one connection at a time, until interrupted or terminated.
+    """
+    import logging
+    import signal
+    import socketserver
+    from contextlib import redirect_stderr, redirect_stdout
+
+    class QueryHandler(socketserver.StreamRequestHandler):
+        """Answer the queries sent over a socket connection, one per line."""
+
+        def handle(self) -> None:
+            out = self.wfile
+            with open(out.fileno(), "w", encoding="utf-8", closefd=False) as text_out:
+                # errors are reported to the client rather than to our stderr
+                with redirect_stdout(text_out), redirect_stderr(text_out):
+                    for raw_line in self.rfile:
+                        line = raw_line.decode("utf-8", errors="replace")
+                        if is_query(line):
+                            answer_query(line.strip(), text_out)
+
+    if os.path.exists(socket_path):
+        if not is_stale_socket(socket_path):
+            print(f"{program}: '{socket_path}' already exists", file=sys.stderr)
+            return 1
+        logging.info("removing stale socket %s", socket_path)
+        os.unlink(socket_path)
+
+    # being terminated (as by a service manager) is a normal way to stop
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with socketserver.UnixStreamServer(socket_path, QueryHandler) as server:
+        logging.info("serving queries on %s", socket_path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+    return 0
+
+
+def configure_logging() -> None:
+    """Configure logging for this script."""
+    import logging
 
-if __name__ == "__main__":
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s %(levelname)s %(message)s",
         datefmt="%Y-%m-%dT%H:%M:%S%z",
     )
+    logging.debug("program=%s", program)
+
+
+def main() -> int:
+    """Simple main()"""
+
+    # a simple query needs neither argparse nor logging
+    args = parse_simple_args(sys.argv[1:])
+    if args is None:
+        configure_logging()
+        args = parse_args(sys.argv[1:])
+        if args is None:
+            return 1
 
+    if args.batch:
+        return serve_batch(sys.stdin, sys.stdout)
+    if args.socket_path is not None:
+        return serve_socket(args.socket_path)
+
+    return write_guesses(args)
+
+
+program: str
+
+if __name__ == "__main__":
     program = sys.argv[0].rsplit("/", maxsplit=1)[-1]
-    logging.debug("program=%s", program)
 
     sys.exit(main())
@@ -0,0 +1,238 @@
+#! /usr/bin/env python3
+"""
+Benchmark wordle_guesses.py (the cold-start time of a simple query, and the
+throughput, in guesses per second, of generating and outputting guesses),
+comparing the results against a saved JSON baseline so that changes which make
+it slower can be caught.
+"""
+
+import argparse
+import collections
+import io
+import logging
+import os.path
+import statistics
+import subprocess
+import sys
+import time
+
+program: str = ""
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+WORDLE_GUESSES = os.path.join(SCRIPT_DIR, "wordle_guesses.py")
+
+sys.path.insert(0, SCRIPT_DIR)
+from bench_harness import best_time, make_parser, report  # noqa: E402
+import wordle_guesses  # noqa: E402
+
+DEFAULT_BASELINE = "wordle_guesses_bench.json"
+DEFAULT_STARTUP_RUNS = 20
+DEFAULT_STARTUP_QUERY = ["-e", "risengycuk", ".a_am"]
+DEFAULT_REPEATS = 5
+
+STARTUP = "startup"
+THROUGHPUT = "throughput"
+
+IMPORT_TIME_PREFIX = "import time:"
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    """
+    Given command-line arguments, return the parsed arguments.
+    """
+    parser = make_parser(
+        """\
+            Benchmark wordle_guesses.py and compare the results against a
+            baseline previously saved by this program. The exit status is 1
+            if any result is worse than the baseline by more than the
+            tolerance.
+            """,
+        DEFAULT_BASELINE,
+        DEFAULT_REPEATS,
+    )
+    parser.add_argument(
+        "-r",
+        "--runs",
+        type=int,
+        default=DEFAULT_STARTUP_RUNS,
+        help=f"""specify the number of times wordle_guesses.py is started for the
+        startup benchmark. The default is {DEFAULT_STARTUP_RUNS}.""",
+    )
+    parser.add_argument(
+        "-o",
+        "--only",
+        choices=[STARTUP, THROUGHPUT],
+        help="run only the startup or only the throughput benchmarks",
+    )
+
+    args = parser.parse_args(argv)
+    logging.debug("args=%s", args)
+    return args
+
+
+def total_import_time_us(importtime_output: str) -> int:
+    """
+    Given the standard error of 'python -X importtime', return the total
+    time spent importing modules, in microseconds. Only top-level imports
+    are summed, as their cumulative times include those of nested imports.
+    """
+    total = 0
+    for line in importtime_output.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        _, cumulative, name = line[len(IMPORT_TIME_PREFIX) :].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            total += int(cumulative)
+    return total
+
+
+def bench_startup(runs: int) -> dict[str, float]:
+    """
+    Start wordle_guesses.py 'runs' times for a simple query, and return the
+    median wall-clock time and median total import time, in milliseconds.
+    """
+    command = [sys.executable, "-X", "importtime", WORDLE_GUESSES]
+    command += DEFAULT_STARTUP_QUERY
+    wall_times = []
+    import_times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run(command, capture_output=True, text=True, check=True)
+        wall_times.append(time.perf_counter() - start)
+        import_times.append(total_import_time_us(completed.stderr))
+
+    return {
+        "startup_wall_ms": statistics.median(wall_times) * 1000,
+        "startup_import_ms": statistics.median(import_times) / 1000,
+    }
+
+
+# (name, template, excluded letters, guesses per line) for the throughput benchmarks
+THROUGHPUT_CASES = [
+    ("1_wildcard", ".A_AM", "RISENGYCUK", 5),
+    ("2_wildcards", ".A.AM", "", 5),
+    ("3_wildcards", "..._M", "", 5),
+    ("4_wildcards", "....M", "", 5),
+    ("4_wildcards_wide", "....M", "", 1000),
+]
+
+
+def consume(iterator) -> None:
+    """Run 'iterator' to exhaustion, discarding what it generates."""
+    collections.deque(iterator, maxlen=0)
+
+
+def check_case(template: str, excluded: str, num_per_line: int) -> int:
+    """
+    Check that wordle_guesses.py gives sensible output for one of the
+    THROUGHPUT_CASES, so that a benchmark can't appear to get faster by
+    getting things wrong. Returns the number of guesses for the case.
+    """
+    num_letters = 26 - len(set(excluded))
+    expected = num_letters ** template.count(wordle_guesses.CHANGE_CHAR)
+
+    guesses = list(wordle_guesses.list_guesses(template, set(excluded), set()))
+    assert len(guesses) == expected, f"{template}: {len(guesses)} != {expected}"
+    assert guesses == sorted(set(guesses)), f"{template}: duplicate or unsorted"
+    for case in wordle_guesses.OutputCase:
+        for guess in guesses[:100]:
+            transformed = case.transform(guess)
+            assert transformed.upper() == guess, f"{case}: {guess} -> {transformed}"
+
+    lines = list(wordle_guesses.marshall_guesses(guesses, num_per_line))
+    assert len(lines) == -(-expected // num_per_line), f"{template}: line count"
+    assert "\t".join(lines).split("\t") == guesses, f"{template}: lines"
+
+    return expected
+
+
+# (template, feedback, guess expected, guess not expected) for check_feedback()
+FEEDBACK_CASES = [
+    # a green letter at a blank position is already placed
+    ("_....", [("CRANE", "G----")], "_BBBB", "_BBBR"),
+    # a blank may stand in for a yellow letter
+    ("_....", [("CRANE", "-Y---")], "_BBBB", "_RBBB"),
+]
+
+
+def check_feedback() -> None:
+    """
+    Check that the guesses generated for the FEEDBACK_CASES, where a blank
+    position may stand in for a letter the feedback requires, include (and
+    exclude) the expected guesses.
+    """
+    for template, feedback, expected, unexpected in FEEDBACK_CASES:
+        constraints = wordle_guesses.Constraints.compile(
+            template, set(), set(), feedback
+        )
+        guesses = set(constraints.generate())
+        assert expected in guesses, f"{template} {feedback}: no {expected}"
+        assert unexpected not in guesses, f"{template} {feedback}: {unexpected}"
+
+
+def bench_throughput(repeats: int) -> dict[str, float]:
+    """
+    Time list_guesses(), OutputCase.transform(), marshall_guesses(), and the
+    whole pipeline through to print_guesses(), for each of the THROUGHPUT_CASES.
+    Return the throughput of each, in guesses per second.
+    """
+    wg = wordle_guesses
+    results = {}
+    for name, template, excluded, num_per_line in THROUGHPUT_CASES:
+        count = check_case(template, excluded, num_per_line)
+        excluded_letters = set(excluded)
+        guesses = list(wg.list_guesses(template, excluded_letters, set()))
+
+        def list_only():
+            consume(wg.list_guesses(template, excluded_letters, set()))
+
+        def transform_only():
+            consume(map(wg.OutputCase.TITLE.transform, guesses))
+
+        def marshall_only():
+            consume(wg.marshall_guesses(guesses, num_per_line))
+
+        def pipeline():
+            generated = wg.list_guesses(template, excluded_letters, set())
+            transformed = map(wg.OutputCase.TITLE.transform, generated)
+            lines = wg.marshall_guesses(transformed, num_per_line)
+            wg.print_guesses(lines, io.StringIO())
+
+        for stage, func in (
+            ("list", list_only),
+            ("transform", transform_only),
+            ("marshall", marshall_only),
+            ("pipeline", pipeline),
+        ):
+            results[f"{name}_{stage}_guesses_per_sec"] = count / best_time(
+                func, repeats
+            )
+
+    return results
+
+
+def main() -> int:
+    """Simple main()"""
+
+    args = parse_args(sys.argv[1:])
+
+    check_feedback()
+    results = {}
+    if args.only in (None, STARTUP):
+        results.update(bench_startup(args.runs))
+    if args.only in (None, THROUGHPUT):
+        results.update(bench_throughput(args.repeats))
+    return report(program, results, args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%Y-%m-%dT%H:%M:%S%z",
+    )
+
+    program = sys.argv[0].rsplit("/", maxsplit=1)[-1]
+    logging.debug("program=%s", program)
+
+    sys.exit(main())